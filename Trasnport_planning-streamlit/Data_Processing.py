@@ -1,7 +1,17 @@
 import pandas as pd
-from sklearn.model_selection import train_test_split
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import duckdb
 import os
+import time
+import json
+import hashlib
+import argparse
 import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import config
 
 # Setting up logging
 log_dir = 'logs'
@@ -27,60 +37,572 @@ logger.addHandler(file_handler)
 
 logger.info("Reading the file....")
 
-def load_data(parquet_path, output_dir):
-    try:
-        file_name = os.path.basename(parquet_path)
-        month_tag = file_name.replace("yellow_tripdata_", "").replace(".parquet", "")
-        df = pd.read_parquet(parquet_path)
+SAMPLE_FRACTION = 0.1
+RANDOM_STATE = 42
+PICKUP_COLUMN = 'tpep_pickup_datetime'
+
+# One stratum per (hour, day of week); rows without a pickup time get their own stratum
+N_STRATA = 24 * 7 + 1
+_NULL_STRATUM = N_STRATA - 1
+# (stratum, ordinal) pairs are packed into a single int64 key, ordinal in the low bits
+_KEY_STRIDE = 1 << 40
+
+# Sampled files are sorted on these columns and written in row groups small enough
+# for min/max statistics to prune a few days of pickups at a time
+SORT_COLUMNS = [PICKUP_COLUMN, 'PULocationID']
+ROW_GROUP_SIZE = 64 * 1024
+
+# Cleaned layer: nulls filled the way the pages used to after loading, and the fuel
+# cost charged per paid mile in the profit column. passenger_count stays null where
+# unknown, so averages of it (Data Insights) only count trips that report it.
+FILL_VALUES = {
+    'RatecodeID': -1,
+    'store_and_fwd_flag': 'N',
+    'congestion_surcharge': 0,
+    'Airport_fee': 0,
+    'cbd_congestion_fee': 0,
+}
+FUEL_COST_PER_MILE = config.FUEL_COST_PER_MILE
+
+# Trip cube: grouping keys and the columns summed per group
+CUBE_KEYS = ['Date', 'Hour', 'PULocationID', 'DOLocationID']
+CUBE_MEASURES = [
+    'passenger_count', 'trip_distance', 'duration_seconds', 'fare_amount', 'tip_amount', 'total_amount',
+    'congestion_surcharge', 'cbd_congestion_fee', 'Airport_fee', 'profit',
+]
+
+# Idle gaps: longer gaps between trips are off-shift time, not waiting for a fare
+MAX_IDLE_MINUTES = 180
+# Gaps longer than this that end in another zone count as cruising for a fare
+CRUISING_MINUTES = 15
+
+# Gaps between consecutive trips of the same vendor over one month of raw trips; the
+# cleaning filters are applied first so the stats line up with the cleaned layer.
+# VendorID pools every cab of a vendor (there is no cab or driver key), so these are
+# vendor throughput gaps, not the time a driver waits for a fare
+IDLE_GAPS_SQL = """
+WITH trips AS (
+    SELECT VendorID, tpep_pickup_datetime AS pickup, tpep_dropoff_datetime AS dropoff,
+           PULocationID, DOLocationID
+    FROM read_parquet('{path}')
+    WHERE total_amount > 0 AND trip_distance <= 100 AND year(tpep_pickup_datetime) = {year}
+      AND tpep_dropoff_datetime > tpep_pickup_datetime
+), gaps AS (
+    SELECT PULocationID, hour(pickup) AS Hour,
+           LAG(DOLocationID) OVER w AS prev_dropoff_zone,
+           date_diff('second', LAG(dropoff) OVER w, pickup) / 60.0 AS idle_minutes
+    FROM trips
+    WINDOW w AS (PARTITION BY VendorID ORDER BY pickup)
+)
+SELECT PULocationID, Hour, prev_dropoff_zone,
+       CASE WHEN idle_minutes BETWEEN 0 AND {max_idle} THEN idle_minutes END AS idle_minutes
+FROM gaps
+"""
+
+
+def _strata_codes(pickup):
+    """Map a pickup timestamp column to integer stratum codes hour * 7 + day_of_week."""
+    codes = pc.add(pc.multiply(pc.hour(pickup), 7), pc.day_of_week(pickup))
+    return pc.fill_null(codes, _NULL_STRATUM).to_numpy().astype(np.int64)
+
+
+def _count_strata(parquet_file):
+    """First pass: count rows per stratum reading only the pickup column."""
+    counts = np.zeros(N_STRATA, dtype=np.int64)
+    for batch in parquet_file.iter_batches(columns=[PICKUP_COLUMN]):
+        counts += np.bincount(_strata_codes(batch.column(0)), minlength=N_STRATA)
+    return counts
+
+
+def _allocate(counts, fraction):
+    """
+    Per-stratum sample sizes for a stratified split of `fraction` of the rows.
+
+    Like train_test_split, strata with a single row are dropped, the sample holds
+    ceil(fraction * n) rows and every stratum gets its proportional share, with the
+    leftover rows going to the strata with the largest remainders.
+    """
+    counts = np.where(counts > 1, counts, 0)
+    total = counts.sum()
+    if total == 0:
+        return counts
+    n_sample = int(np.ceil(fraction * total))
+    exact = counts * n_sample / total
+    targets = np.floor(exact).astype(np.int64)
+    leftover = n_sample - targets.sum()
+    if leftover > 0:
+        remainders = np.where(counts > targets, exact - targets, -1.0)
+        targets[np.argsort(-remainders, kind='stable')[:leftover]] += 1
+    return targets
+
+
+def _selected_keys(counts, targets, rng):
+    """Draw the sampled row ordinals of every stratum, packed into sorted int64 keys."""
+    keys = [
+        code * _KEY_STRIDE + rng.choice(counts[code], size=targets[code], replace=False)
+        for code in np.flatnonzero(targets)
+    ]
+    if not keys:
+        return np.empty(0, dtype=np.int64)
+    return np.sort(np.concatenate(keys))
 
-        logger.info(f"{file_name} Data loaded successfully with shape: {df.shape}")
-        logger.info("Creating the stratify variable for sampling...")
-        
-        # Create a stratify variable based on 'passenger_count' for stratified sampling
-        df['Hour'] = pd.to_datetime(df['tpep_pickup_datetime']).dt.hour
-        df['Day of Week'] = pd.to_datetime(df['tpep_pickup_datetime']).dt.dayofweek
 
-        # Combine 'Hour' and 'Day of Week' to create a stratify variable
-        df['Stratify_Var'] = df['Hour'].astype(str) + '_' + df['Day of Week'].astype(str)
+def _row_keys(codes, seen):
+    """Key of each row: its stratum and its running ordinal within that stratum."""
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    within = np.arange(len(codes)) - np.searchsorted(sorted_codes, sorted_codes, side='left')
+    ordinals = np.empty(len(codes), dtype=np.int64)
+    ordinals[order] = seen[sorted_codes] + within
+    seen += np.bincount(codes, minlength=N_STRATA)
+    return codes * _KEY_STRIDE + ordinals
 
-        # ✅ IMPORTANT: remove rare strata
-        df = df.groupby('Stratify_Var').filter(lambda x: len(x) > 1)
 
-        logger.info("Stratify variable created successfully.")
-        df_train, df_sampled = train_test_split(
-            df, test_size=0.1, random_state=42, stratify=df['Stratify_Var']
-        )
+def stratified_sample_parquet(parquet_path, output_file, fraction=SAMPLE_FRACTION, random_state=RANDOM_STATE):
+    """
+    Write an exact per-(hour, day of week) stratified sample of a trip file.
 
-        df = df_sampled.drop(columns=['Hour', 'Day of Week', 'Stratify_Var'])
+    The file is read one row group at a time, twice: once to count the strata and once
+    to keep the rows drawn for each of them. Memory stays bounded by the sample size
+    and a single row group instead of the whole month. The sample is written sorted
+    (see write_sorted). Returns (rows read, rows kept).
+    """
+    parquet_file = pq.ParquetFile(parquet_path)
+    counts = _count_strata(parquet_file)
+    targets = _allocate(counts, fraction)
+    selected = _selected_keys(counts, targets, np.random.default_rng(random_state))
 
-        logger.info(f"Data sampled successfully with new shape: {df.shape}")
+    seen = np.zeros(N_STRATA, dtype=np.int64)
+    kept = []
+    for i in range(parquet_file.num_row_groups):
+        table = parquet_file.read_row_group(i)
+        keys = _row_keys(_strata_codes(table.column(PICKUP_COLUMN)), seen)
+        pos = np.minimum(np.searchsorted(selected, keys), max(len(selected) - 1, 0))
+        mask = selected[pos] == keys if len(selected) else np.zeros(len(keys), dtype=bool)
+        kept.append(table.filter(pa.array(mask)))
+
+    sample = pa.concat_tables(kept) if kept else parquet_file.schema_arrow.empty_table()
+    write_sorted(sample, output_file)
+    return int(counts.sum()), int(targets.sum())
+
+
+def write_sorted(table, output_file, sort_columns=SORT_COLUMNS):
+    """
+    Write a table sorted by `sort_columns` in row groups of ROW_GROUP_SIZE rows.
+
+    Sorting keeps the min/max statistics of each row group narrow, so date and zone
+    filters skip whole row groups instead of decoding them.
+    """
+    sort_columns = [c for c in sort_columns if c in table.column_names]
+    table = table.sort_by([(c, 'ascending') for c in sort_columns])
+    sorting_columns = [pq.SortingColumn(table.schema.get_field_index(c)) for c in sort_columns]
+    tmp_file = output_file + '.tmp'
+    pq.write_table(
+        table, tmp_file,
+        row_group_size=ROW_GROUP_SIZE,
+        write_statistics=True,
+        sorting_columns=sorting_columns,
+        write_page_index=True,
+        compression='zstd',
+    )
+    os.replace(tmp_file, output_file)
+
+
+def load_data(parquet_path, output_dir, fraction=SAMPLE_FRACTION, random_state=RANDOM_STATE):
+    try:
+        file_name = os.path.basename(parquet_path)
+        month_tag = file_name.replace("yellow_tripdata_", "").replace(".parquet", "")
         output_file = os.path.join(output_dir, f"{month_tag}_sampled_data.parquet")
-        df.to_parquet(output_file, index=False)
+
+        logger.info(f"Sampling {file_name} by hour and day of week...")
+        rows_read, rows_kept = stratified_sample_parquet(parquet_path, output_file, fraction, random_state)
+        logger.info(f"{file_name} sampled from {rows_read} to {rows_kept} rows.")
         logger.info(f"Sampled data saved to '{output_file}'.")
 
-        return df
+        return pd.read_parquet(output_file)
     except Exception as e:
         logger.error(f"Error loading data: {e}")
         raise
 
-# Directory setup
-output_dir = r"C:\Users\Shaaf\Desktop\Data Science\Practice Projects\Transport Planning\Sampled_Data"
-os.makedirs(output_dir, exist_ok=True)
+def _month_tag(parquet_path):
+    return os.path.basename(parquet_path).replace("yellow_tripdata_", "").replace(".parquet", "")
 
-DATA_DIR = r"C:\Users\Shaaf\Desktop\Data Science\Practice Projects\Transport Planning\Data"
-parquet_files = [
-    f for f in os.listdir(DATA_DIR)
-    if f.endswith(".parquet") and f.startswith("yellow_tripdata_")
-]
-all_df=[]
-# ✅ FIX: Loop through all parquet files
-for parquet_file in parquet_files:
-    parquet_path = os.path.join(DATA_DIR, parquet_file)
-    df = load_data(parquet_path, output_dir)
-    all_df.append(df)
-
-# Combine all sampled dataframes into one
-combined_df = pd.concat(all_df, ignore_index=True, axis=0)
-combined_output_file = os.path.join(output_dir, "combined_sampled_data.parquet")
-combined_df.to_parquet(combined_output_file, index=False)
-logger.info(f"Combined sampled data saved to '{combined_output_file}' with shape: {combined_df.shape}")
\ No newline at end of file
+
+def _partition(month_tag):
+    """Hive partition directory of a month, e.g. '2025-01' -> 'year=2025/month=1'."""
+    year, month = month_tag.split('-')
+    return os.path.join(f"year={int(year)}", f"month={int(month)}")
+
+
+def _file_checksum(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def clean_month(sampled_file, cleaned_file, year):
+    """
+    Build the cleaned layer of one sampled month and return its row count.
+
+    Drops non-positive totals, trips over 100 miles and pickups outside the partition's
+    year, fills the nullable columns the pages rely on, and adds the derived Date, Hour,
+    DayOfWeek and profit columns.
+
+    Dropping other years is intended: TLC files are published by pickup month, so the
+    few pickups of another year in a file are mostly clock errors, and a New Year's Eve
+    trip filed in January is not worth reading the next year's partitions for (see
+    data_access.year_filter). The count dropped is logged.
+    """
+    table = pq.read_table(sampled_file)
+    in_year = pc.equal(pc.year(table.column(PICKUP_COLUMN)), year)
+    out_of_year = table.num_rows - pc.sum(pc.cast(pc.fill_null(in_year, True), pa.int64())).as_py()
+    if out_of_year:
+        logger.info(f"{os.path.basename(sampled_file)}: dropping {out_of_year} pickups outside {year}.")
+    keep = pc.and_(
+        pc.and_(pc.greater(table.column('total_amount'), 0), pc.less_equal(table.column('trip_distance'), 100)),
+        in_year,
+    )
+    table = table.filter(keep)
+
+    for name, value in FILL_VALUES.items():
+        if name in table.column_names:
+            column = table.column(name)
+            filled = pc.fill_null(column, pa.scalar(value).cast(column.type))
+            table = table.set_column(table.schema.get_field_index(name), name, filled)
+
+    pickup = table.column(PICKUP_COLUMN)
+    revenue = pc.add(table.column('fare_amount'), pc.fill_null(table.column('tip_amount'), 0))
+    profit = pc.subtract(revenue, pc.multiply(table.column('trip_distance'), FUEL_COST_PER_MILE))
+    table = (
+        table
+        .append_column('Date', pc.cast(pickup, pa.date32()))
+        .append_column('Hour', pc.cast(pc.hour(pickup), pa.int8()))
+        .append_column('DayOfWeek', pc.cast(pc.day_of_week(pickup), pa.int8()))
+        .append_column('profit', profit)
+    )
+    write_sorted(table, cleaned_file)
+    return table.num_rows
+
+
+def build_cube(cleaned_file, cube_file):
+    """
+    Aggregate one cleaned month into the trip cube and return its row count.
+
+    One row per (Date, Hour, PULocationID, DOLocationID) with the trip count
+    and the sums of CUBE_MEASURES, enough to answer the pages' grouped summaries without
+    reading trip-level rows. Means are recovered as sum / trip_count.
+    """
+    table = pq.read_table(cleaned_file)
+    table = table.append_column(
+        'duration_seconds',
+        pc.seconds_between(table.column(PICKUP_COLUMN), table.column('tpep_dropoff_datetime')),
+    )
+    for name in CUBE_MEASURES:
+        if name not in table.column_names:
+            table = table.append_column(name, pa.array(np.zeros(table.num_rows)))
+
+    sum_options = pc.ScalarAggregateOptions(min_count=0)
+    cube = table.group_by(CUBE_KEYS).aggregate(
+        [('PULocationID', 'count')] + [(name, 'sum', sum_options) for name in CUBE_MEASURES]
+    )
+    cube = cube.rename_columns(
+        ['trip_count' if c == 'PULocationID_count' else c.removesuffix('_sum') for c in cube.column_names]
+    )
+    types = {
+        'Date': pa.date32(), 'Hour': pa.int8(), 'PULocationID': pa.int16(), 'DOLocationID': pa.int16(),
+        'trip_count': pa.int32(),
+    }
+    cube = pa.table({
+        name: pc.cast(cube.column(name), types.get(name, pa.float64()))
+        for name in CUBE_KEYS + ['trip_count'] + CUBE_MEASURES
+    })
+    write_sorted(cube, cube_file, sort_columns=CUBE_KEYS)
+    return cube.num_rows
+
+
+def build_vendor_cube(cleaned_file, vendor_file):
+    """Roll one cleaned month up to trips per (Date, VendorID) and return its row count."""
+    table = pq.read_table(cleaned_file, columns=['Date', 'VendorID'])
+    rollup = table.group_by(['Date', 'VendorID']).aggregate([('Date', 'count')])
+    rollup = pa.table({
+        'Date': pc.cast(rollup.column('Date'), pa.date32()),
+        'VendorID': pc.cast(rollup.column('VendorID'), pa.int16()),
+        'trip_count': pc.cast(rollup.column('Date_count'), pa.int32()),
+    })
+    write_sorted(rollup, vendor_file, sort_columns=['Date', 'VendorID'])
+    return rollup.num_rows
+
+
+def idle_month(parquet_path, idle_file, flows_file, year):
+    """
+    Write the idle statistics of one full (unsampled) month and return their row count.
+
+    Trips are ordered per VendorID, the only fleet key the TLC data has, and the gap
+    from each drop-off to the vendor's next pickup is recorded. With all of a vendor's
+    cabs pooled that is a throughput gap of the vendor, not a driver's idle time, so
+    the outputs are descriptive only. DuckDB runs the window out of core, so full months
+    never have to fit in memory. Two outputs:
+
+    - idle_file: per (PULocationID, Hour), trips, the gaps seen and their total and
+      median minutes, and how many were cruising (long gap ending in another zone).
+    - flows_file: per (from_zone, to_zone, Hour), the empty repositioning moves between
+      a drop-off and a pickup in another zone, and their idle minutes.
+    """
+    gaps = IDLE_GAPS_SQL.format(path=parquet_path.replace("'", "''"), year=int(year), max_idle=MAX_IDLE_MINUTES)
+    con = duckdb.connect()
+    try:
+        # Months already run in parallel worker processes: one DuckDB thread each
+        con.execute("SET threads = 1")
+        con.execute(f"CREATE TEMP VIEW gaps AS {gaps}")
+        idle = con.execute(f"""
+            SELECT PULocationID::SMALLINT AS PULocationID, Hour::TINYINT AS Hour,
+                   COUNT(*)::INTEGER AS trips,
+                   COUNT(idle_minutes)::INTEGER AS idle_trips,
+                   COALESCE(SUM(idle_minutes), 0)::DOUBLE AS idle_minutes,
+                   median(idle_minutes)::DOUBLE AS idle_minutes_median,
+                   COUNT(*) FILTER (
+                       WHERE idle_minutes > {CRUISING_MINUTES} AND prev_dropoff_zone <> PULocationID
+                   )::INTEGER AS cruising_trips
+            FROM gaps GROUP BY ALL
+        """).fetch_arrow_table()
+        flows = con.execute("""
+            SELECT prev_dropoff_zone::SMALLINT AS from_zone, PULocationID::SMALLINT AS to_zone,
+                   Hour::TINYINT AS Hour,
+                   COUNT(*)::INTEGER AS trips,
+                   SUM(idle_minutes)::DOUBLE AS idle_minutes
+            FROM gaps
+            WHERE idle_minutes IS NOT NULL AND prev_dropoff_zone <> PULocationID
+            GROUP BY ALL
+        """).fetch_arrow_table()
+    finally:
+        con.close()
+    write_sorted(idle, idle_file, sort_columns=['PULocationID', 'Hour'])
+    write_sorted(flows, flows_file, sort_columns=['from_zone', 'to_zone', 'Hour'])
+    return idle.num_rows
+
+
+def sample_month(parquet_path, output_dir, fraction=SAMPLE_FRACTION, random_state=RANDOM_STATE):
+    """
+    Sample and clean one month into its partitions, summarise it into the cube, the
+    vendor rollup and the idle statistics, and return its manifest entry.
+    """
+    started = time.perf_counter()
+    month_tag = _month_tag(parquet_path)
+    partition = _partition(month_tag)
+    dataset_dir = os.path.join(output_dir, DATASET_DIR)
+    cleaned_dir = os.path.join(output_dir, CLEANED_DIR)
+    cube_dir = os.path.join(output_dir, CUBE_DIR)
+    vendor_dir = os.path.join(output_dir, VENDOR_CUBE_DIR)
+    idle_dir = os.path.join(output_dir, IDLE_DIR)
+    flows_dir = os.path.join(output_dir, REPOSITION_DIR)
+    for root in (dataset_dir, cleaned_dir, cube_dir, vendor_dir, idle_dir, flows_dir):
+        os.makedirs(os.path.join(root, partition), exist_ok=True)
+    output_file = os.path.join(dataset_dir, partition, f"{month_tag}_sampled_data.parquet")
+    cleaned_file = os.path.join(cleaned_dir, partition, f"{month_tag}_cleaned_data.parquet")
+    cube_file = os.path.join(cube_dir, partition, f"{month_tag}_cube.parquet")
+    vendor_file = os.path.join(vendor_dir, partition, f"{month_tag}_vendor.parquet")
+    idle_file = os.path.join(idle_dir, partition, f"{month_tag}_idle.parquet")
+    flows_file = os.path.join(flows_dir, partition, f"{month_tag}_flows.parquet")
+    rows_read, rows_kept = stratified_sample_parquet(parquet_path, output_file, fraction, random_state)
+    rows_cleaned = clean_month(output_file, cleaned_file, int(month_tag.split('-')[0]))
+    rows_cube = build_cube(cleaned_file, cube_file)
+    rows_vendor = build_vendor_cube(cleaned_file, vendor_file)
+    rows_idle = idle_month(parquet_path, idle_file, flows_file, int(month_tag.split('-')[0]))
+    stat = os.stat(parquet_path)
+    entry = {
+        'source': os.path.basename(parquet_path),
+        'source_size': stat.st_size,
+        'source_mtime': stat.st_mtime,
+        'source_sha256': _file_checksum(parquet_path),
+        'sample_fraction': fraction,
+        'random_state': random_state,
+        'output': os.path.relpath(output_file, dataset_dir),
+        'cleaned_output': os.path.relpath(cleaned_file, cleaned_dir),
+        'cube_output': os.path.relpath(cube_file, cube_dir),
+        'vendor_output': os.path.relpath(vendor_file, vendor_dir),
+        'idle_output': os.path.relpath(idle_file, idle_dir),
+        'flows_output': os.path.relpath(flows_file, flows_dir),
+        'rows_read': rows_read,
+        'rows_sampled': rows_kept,
+        'rows_cleaned': rows_cleaned,
+        'rows_cube': rows_cube,
+        'rows_vendor': rows_vendor,
+        'rows_idle': rows_idle,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+    logger.info(
+        f"{entry['source']} sampled from {rows_read} to {rows_kept} rows ({rows_cleaned} after cleaning) "
+        f"in {entry['seconds']}s."
+    )
+    return month_tag, entry
+
+
+def read_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {'months': {}}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def write_manifest(manifest, manifest_path):
+    tmp_file = manifest_path + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, manifest_path)
+
+
+def _is_unchanged(parquet_path, entry, output_dir, fraction=SAMPLE_FRACTION, random_state=RANDOM_STATE):
+    """
+    Whether a month can be skipped: it was sampled with the same fraction and seed and
+    its source is the same. Size and mtime are compared first; the file is only hashed
+    when its size matches but its mtime moved (e.g. a re-download of the same month).
+    """
+    if entry is None or not all(os.path.exists(os.path.join(*f)) for f in _output_files(output_dir, entry)):
+        return False
+    if entry.get('sample_fraction') != fraction or entry.get('random_state') != random_state:
+        return False
+    stat = os.stat(parquet_path)
+    if stat.st_size != entry['source_size']:
+        return False
+    if stat.st_mtime == entry['source_mtime']:
+        return True
+    if _file_checksum(parquet_path) != entry['source_sha256']:
+        return False
+    entry['source_mtime'] = stat.st_mtime
+    return True
+
+
+def _output_files(output_dir, entry):
+    """(dataset root, relative path) of every file a month's manifest entry owns."""
+    roots = {
+        'output': DATASET_DIR, 'cleaned_output': CLEANED_DIR, 'cube_output': CUBE_DIR,
+        'vendor_output': VENDOR_CUBE_DIR,
+        'idle_output': IDLE_DIR, 'flows_output': REPOSITION_DIR,
+    }
+    return [(os.path.join(output_dir, root), entry[key]) for key, root in roots.items() if key in entry]
+
+
+def _remove_output(dataset_dir, output):
+    """Delete a month file and the partition directories it leaves empty."""
+    path = os.path.join(dataset_dir, output)
+    if os.path.exists(path):
+        os.remove(path)
+    parent = os.path.dirname(path)
+    while os.path.normpath(parent) != os.path.normpath(dataset_dir) and not os.listdir(parent):
+        os.rmdir(parent)
+        parent = os.path.dirname(parent)
+
+
+def run(data_dir, output_dir, workers=None, full=False, fraction=SAMPLE_FRACTION, random_state=RANDOM_STATE):
+    """
+    Bring the datasets in `output_dir` up to date with the trip files in `data_dir`.
+
+    The sampled, cleaned, cube, vendor and idle datasets are Hive-partitioned directories
+    (year=YYYY/month=M) holding one sorted file per month. Only months that are new or
+    changed since the last run (per the manifest), or were sampled with another
+    `fraction` or `random_state`, are sampled again, and only their files are replaced;
+    files of months whose source disappeared are removed.
+    """
+    dataset_dir = os.path.join(output_dir, DATASET_DIR)
+    os.makedirs(dataset_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    previous_manifest = read_manifest(manifest_path)
+    if previous_manifest.get('layout') != LAYOUT:
+        # Files written under an older layout would be picked up by the dataset glob
+        for entry in previous_manifest['months'].values():
+            for root, output in _output_files(output_dir, entry):
+                _remove_output(root, output)
+        previous_manifest = {'months': {}}
+    previous = {} if full else previous_manifest['months']
+
+    parquet_paths = {
+        _month_tag(f): os.path.join(data_dir, f) for f in sorted(os.listdir(data_dir))
+        if f.endswith(".parquet") and f.startswith("yellow_tripdata_")
+    }
+    months = {
+        m: previous[m] for m in parquet_paths
+        if _is_unchanged(parquet_paths[m], previous.get(m), output_dir, fraction, random_state)
+    }
+    pending = [parquet_paths[m] for m in parquet_paths if m not in months]
+    removed = sorted(set(previous) - set(parquet_paths))
+    logger.info(f"{len(pending)} month(s) to sample, {len(months)} unchanged, {len(removed)} removed.")
+
+    started = time.perf_counter()
+    if workers == 1 or len(pending) <= 1:
+        for parquet_path in pending:
+            month_tag, entry = sample_month(parquet_path, output_dir, fraction, random_state)
+            months[month_tag] = entry
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(sample_month, p, output_dir, fraction, random_state) for p in pending]
+            for future in as_completed(futures):
+                month_tag, entry = future.result()
+                months[month_tag] = entry
+
+    for month_tag in removed:
+        for root, output in _output_files(output_dir, previous[month_tag]):
+            _remove_output(root, output)
+
+    manifest = {
+        'layout': LAYOUT,
+        'months': months,
+        'combined': {
+            'output': DATASET_DIR,
+            'rows': sum(entry['rows_sampled'] for entry in months.values()),
+        },
+        'cleaned': {
+            'output': CLEANED_DIR,
+            'rows': sum(entry['rows_cleaned'] for entry in months.values()),
+        },
+        'cube': {
+            'output': CUBE_DIR,
+            'rows': sum(entry['rows_cube'] for entry in months.values()),
+        },
+        'vendor': {
+            'output': VENDOR_CUBE_DIR,
+            'rows': sum(entry['rows_vendor'] for entry in months.values()),
+        },
+        'idle': {
+            'output': IDLE_DIR,
+            'reposition_output': REPOSITION_DIR,
+            'rows': sum(entry['rows_idle'] for entry in months.values()),
+        },
+        'last_run': {
+            'sampled': sorted(_month_tag(p) for p in pending),
+            'removed': removed,
+            'seconds': round(time.perf_counter() - started, 3),
+        },
+    }
+    write_manifest(manifest, manifest_path)
+    logger.info(f"Combined sampled data in '{dataset_dir}' holds {manifest['combined']['rows']} rows.")
+    return manifest
+
+
+# Directory setup (see config.py for the environment overrides)
+DATA_DIR = config.RAW_DATA_DIR
+OUTPUT_DIR = config.SAMPLED_DATA_DIR
+DATASET_DIR = config.DATASET_DIR
+CLEANED_DIR = config.CLEANED_DIR
+CUBE_DIR = config.CUBE_DIR
+VENDOR_CUBE_DIR = config.VENDOR_CUBE_DIR
+IDLE_DIR = config.IDLE_DIR
+REPOSITION_DIR = config.REPOSITION_DIR
+MANIFEST_FILE = config.MANIFEST_FILE
+LAYOUT = "hive/year/month+cleaned+cube+vendor+idle"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sample the monthly TLC trip files into one dataset.")
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Processes sampling months in parallel (default: one per core, 1 runs in-process)")
+    parser.add_argument('--full', action='store_true',
+                        help="Ignore the manifest and sample every month again")
+    parser.add_argument('--fraction', type=float, default=SAMPLE_FRACTION,
+                        help="Share of each month's trips kept by the stratified sample")
+    parser.add_argument('--seed', type=int, default=RANDOM_STATE, help="Random state of the sample")
+    args = parser.parse_args()
+    run(args.data_dir, args.output_dir, args.workers, args.full, args.fraction, args.seed)
@@ -1,29 +1,28 @@
-import pandas as pd
+import numpy as np
 import streamlit as st
-import duckdb
 import matplotlib.pyplot as plt
 import seaborn as sns
 import plotly.express as px
-import json
 from sklearn.preprocessing import MinMaxScaler
+from data_access import cached_query, year_filter
+from zone_geometry import zone_feature_collection
+from zones import load_zones, N_ZONES
+from od_matrix import load_od_matrix
 st.title("🚗 Data Insights" )
-@st.cache_data
-def load_data():
-    con = duckdb.connect(database=':memory:', read_only=False)
-    path=r"C:\Users\Shaaf\Desktop\Data Science\Practice Projects\Transport Planning\Sampled_Data\combined_sampled_data.parquet"
-    df = con.execute(f"SELECT * FROM '{path}'").df()
-    return df
-data = load_data()
-# Data Cleaning
-data=data[data['total_amount']>0]
-data=data[data['trip_distance']<=100]
-# Load geojson
-# with open(r"C:\Users\Shaaf\Desktop\Data Science\Practice Projects\Transport Planning\Sampled_Data\NYC Taxi Zones.geojson") as f:
-#     taxi_zones = json.load(f)
+# Every chart below is an aggregate query over the trip cube (or the cleaned trips for
+# the distance bins) returning only the rows the chart draws
+CUBE_2025 = f"FROM trip_cube WHERE {year_filter(2025, 'Date')}"
+# Zone names and boroughs, resolved by array lookups on LocationID
+zones = load_zones()
+# Origin-destination counts and medians of the same year, as dense arrays
+od = load_od_matrix(2025)
 #Famous Cab Companies
 st.subheader("🚕 Famous Cab Companies")
-company_counts = pd.DataFrame(data['VendorID'].value_counts()).rename_axis("VendorID").reset_index()
-company_counts.sort_values(by="count",inplace=True,ascending=False)
+company_counts = cached_query(f"""
+    SELECT VendorID, SUM(trip_count)::BIGINT AS count
+    FROM vendor_cube WHERE {year_filter(2025, 'Date')}
+    GROUP BY VendorID ORDER BY count DESC
+""")
 
 fig = px.bar(
     company_counts,
@@ -38,8 +37,7 @@ fig.update_traces(textposition="outside")
 st.plotly_chart(fig, use_container_width=True)
 
 st.subheader("🕒 Hourly Ride Distribution")
-data['Hour'] = pd.to_datetime(data['tpep_pickup_datetime']).dt.hour
-hourly_counts = pd.DataFrame(data['Hour'].value_counts()).rename_axis("Hour").reset_index().sort_values(by="Hour")
+hourly_counts = cached_query(f"SELECT Hour, SUM(trip_count)::BIGINT AS count {CUBE_2025} GROUP BY Hour ORDER BY Hour")
 fig3 = px.bar(hourly_counts,
     x="Hour",
     y="count",
@@ -50,18 +48,20 @@ fig3.update_traces(textposition="outside")
 st.plotly_chart(fig3, use_container_width=True)
 
 #Time Series Analysis - Daily Ride Trends
-data=data[data['tpep_pickup_datetime'].dt.year==2025]
-data['Date'] = pd.to_datetime(data['tpep_pickup_datetime'])
-df_resampled=data.set_index('Date')
-df_resample=pd.DataFrame(df_resampled.resample('W').size(),columns=['passenger_count'])
+# Weeks labelled by their closing Sunday, like resample('W')
+df_resample=cached_query(f"""
+    SELECT date_trunc('week', Date) + INTERVAL 6 DAY AS Date, SUM(trip_count)::BIGINT AS passenger_count {CUBE_2025}
+    GROUP BY 1 ORDER BY 1
+""").set_index('Date')
 
 
 st.subheader("📈 Weekly Ride Trends")
 st.line_chart(df_resample)  
 
-data['Month'] = pd.to_datetime(data['tpep_pickup_datetime']).dt.month
-monthly_counts = data['Month'].value_counts().sort_index()
-monthly_counts_df = pd.DataFrame({'Month': monthly_counts.index, 'Ride Count': monthly_counts.values})
+monthly_counts_df = cached_query(f"""
+    SELECT month(Date) AS Month, SUM(trip_count)::BIGINT AS "Ride Count" {CUBE_2025}
+    GROUP BY 1 ORDER BY 1
+""")
 st.subheader("📊 Monthly Ride Distribution")
 fig5 = px.bar(
     monthly_counts_df,
@@ -77,8 +77,10 @@ fig5.update_traces(texttemplate='%{y}', textposition='outside')
 st.plotly_chart(fig5, use_container_width=True)
 
 #Plotting weekend vs weekday demand
-data['is_weekend'] = data['tpep_pickup_datetime'].dt.dayofweek >= 5
-hourly = data.groupby(['Hour', 'is_weekend']).size().reset_index(name='trips')
+hourly = cached_query(f"""
+    SELECT Hour, isodow(Date) >= 6 AS is_weekend, SUM(trip_count)::BIGINT AS trips {CUBE_2025}
+    GROUP BY ALL ORDER BY Hour, is_weekend
+""")
 fig0=px.line(
     hourly,
     x='Hour',
@@ -98,10 +100,13 @@ st.plotly_chart(fig0,use_container_width=True)
 
 ##Plotting Demand Handling vs Surcharge
 st.subheader("Demand vs Surcharge")
-data['Total Congestion Surcharge']=(data['congestion_surcharge']+data['cbd_congestion_fee'])
-data['Total Congestion Surcharge']=data['Total Congestion Surcharge'].fillna(0)
-demand_handling = data.groupby('Hour')['Total Congestion Surcharge'].mean().reset_index()
-demand_handling['Trip Count']=data.groupby('Hour').size().values
+demand_handling = cached_query(f"""
+    SELECT Hour,
+           (SUM(congestion_surcharge) + SUM(cbd_congestion_fee)) / SUM(trip_count) AS "Total Congestion Surcharge",
+           SUM(trip_count)::BIGINT AS "Trip Count"
+    {CUBE_2025}
+    GROUP BY Hour ORDER BY Hour
+""")
 scaler = MinMaxScaler()
 demand_handling[['Total Congestion Surcharge', 'Trip Count']] = scaler.fit_transform(demand_handling[['Total Congestion Surcharge', 'Trip Count']])
 df_long = demand_handling.melt(
@@ -125,15 +130,11 @@ st.plotly_chart(fig6,use_container_width=False)
 
 #plotting famous pickup points
 st.subheader("📍 Most Popular Pickup Boroughs")
-locations_data = pd.read_csv(r"C:\Users\Shaaf\Desktop\Data Science\Practice Projects\Transport Planning\Sampled_Data\taxi_zone_lookup.csv")
-locations_name = locations_data[['LocationID', 'Zone']]
-famous_trips = data.groupby(['PULocationID', 'DOLocationID']).size().reset_index(name='trip_count')
-famous_trips = famous_trips.sort_values(by='trip_count', ascending=False)
-famous_trips['Pick up Borough'] = famous_trips['PULocationID'].map(locations_data.set_index('LocationID')['Borough'])
-famous_trips['Drop off Borough'] = famous_trips['DOLocationID'].map(locations_data.set_index('LocationID')['Borough'])
+# Number of distinct origin-destination pairs starting in each borough
+hotspots = zones.borough_totals(np.arange(N_ZONES), (od.trips() > 0).sum(axis=1)).astype(np.int64).nlargest(5)
+hotspots.index.name = 'Borough'
 
 #most pickup zones
-hotspots=famous_trips['Pick up Borough'].value_counts().head(5)
 fig9=px.bar(hotspots, x=hotspots.index, y=hotspots.values, title='Most Popular Pickup Boroughs')
 fig9.update_layout(xaxis_title='Borough', yaxis_title='Number of Pickups')
 fig9.update_traces(marker_color=hotspots.values)
@@ -146,21 +147,21 @@ st.plotly_chart(fig9,use_container_width=True)
 
 # Ensure ID datatype matches GeoJSON
 
-zone_stats = (
-    data
-    .groupby('PULocationID')
-    .size()
-    .reset_index(name='Trip_Count')
-).sort_values(by='Trip_Count', ascending=False).head(30)
+zone_stats = cached_query(f"""
+    SELECT PULocationID, SUM(trip_count)::BIGINT AS Trip_Count {CUBE_2025}
+    GROUP BY PULocationID ORDER BY Trip_Count DESC LIMIT 30
+""")
+zone_stats['Zone'] = zones.names(zone_stats['PULocationID'].to_numpy(dtype=np.int64))
 zone_stats['PULocationID'] = zone_stats['PULocationID'].astype(str)
 
-with open(r"C:\Users\Shaaf\Desktop\Data Science\Practice Projects\Transport Planning\Sampled_Data\NYC Taxi Zones.geojson") as f:
-    taxi_zones_geo = json.load(f)
+# Simplified polygons of just the plotted zones (cached once per server process)
+taxi_zones_geo = zone_feature_collection(zone_stats['PULocationID'])
 
 fig10 = px.choropleth_mapbox(
     zone_stats,
     geojson=taxi_zones_geo,
     locations='PULocationID',
+    hover_name='Zone',
     featureidkey="properties.location_id",  # Ensure this matches the GeoJSON property
     color='Trip_Count',
     color_continuous_scale='Viridis',
@@ -180,13 +181,21 @@ st.plotly_chart(fig10,use_container_width=True)
 ##Distance and Bins plot
 bins= [0, 5, 10, 20, 30, 50, 100]
 labels = ['0-5km', '5-10km', '10-20km', '20-30km', '30-50km', '50-100km']
-data['Distance_Bin'] = pd.cut(data['trip_distance'], bins=bins, labels=labels, right=False)
+# Bins closed on the left like pd.cut(..., right=False); distances outside [0, 100) are left out
+distance_bin = "CASE " + " ".join(
+    f"WHEN trip_distance >= {low} AND trip_distance < {high} THEN '{label}'"
+    for low, high, label in zip(bins[:-1], bins[1:], labels)
+) + " END"
 st.subheader("🚙 Trip Distance Distribution")
-summary = data.groupby('Distance_Bin').agg(
-    trips=('passenger_count', 'size'),
-    total_passengers=('passenger_count', 'sum'),
-    avg_passengers=('passenger_count', 'mean')
-)
+summary = cached_query(f"""
+    SELECT {distance_bin} AS Distance_Bin,
+           COUNT(*) AS trips,
+           SUM(passenger_count) AS total_passengers,
+           AVG(passenger_count) AS avg_passengers
+    FROM trips WHERE {year_filter(2025)}
+    GROUP BY 1 HAVING Distance_Bin IS NOT NULL
+""").set_index('Distance_Bin').reindex(labels).fillna({'trips': 0, 'total_passengers': 0})
+summary.index.name = 'Distance_Bin'
 fig11 = px.bar(
     summary.reset_index(),
     x='Distance_Bin',
@@ -1,14 +1,9 @@
 import pandas as pd
 import streamlit as st
-import duckdb
 import matplotlib.pyplot as plt
 import seaborn as sns
 import plotly.express as px
-import json
-import os
-import time
 from prophet import Prophet
-import pickle
 from sklearn.preprocessing import MinMaxScaler
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score,root_mean_squared_error
 from pmdarima import auto_arima
@@ -17,32 +12,19 @@ from meteostat import Point, Hourly
 import holidays
 from xgboost import XGBRegressor
 import numpy as np
+import config
+from data_access import summarize_cube, year_filter
+from model_registry import data_fingerprint, load_model, train_and_register
 
 st.title("🚗 Demand Forecasting")
 @st.cache_data
 def load_data():
-    con = duckdb.connect(database=':memory:', read_only=False)
-    path=r"C:\Users\Shaaf\Desktop\Data Science\Practice Projects\Transport Planning\Sampled_Data\combined_sampled_data.parquet"
-    df = con.execute(f"SELECT * FROM '{path}'").df()
-    return df
+    # Hourly trip counts straight from the trip cube
+    # NumPy-backed: the series feeds statsmodels, Prophet and XGBoost
+    return summarize_cube(['Date', 'Hour'], ['trip_count'], where=year_filter(2025, 'Date'), dtype_backend='numpy')
 data = load_data()
 
-#filling null values
-data['passenger_count'].fillna(0, inplace=True)
-data['RatecodeID'].fillna(-1, inplace=True)
-data['store_and_fwd_flag'].fillna('N', inplace=True)
-data['congestion_surcharge'].fillna(0, inplace=True)
-data['Airport_fee'].fillna(0, inplace=True)
-
-data=data[data['total_amount']>0]
-data=data[data['trip_distance']<=100]
-data['Date']=data['tpep_pickup_datetime'].dt.date
-data['Hour']=data['tpep_pickup_datetime'].dt.hour
-data['Date']=pd.to_datetime(data['Date'])
-data=data[(data['Date'].dt.year)==2025]
-
-resampling = data.groupby(['Date','Hour']).size().reset_index()
-resampling =resampling.rename(columns={0:'Trips'})
+resampling = data.rename(columns={'trip_count':'Trips'})
 resampling['Date & Time']=(resampling['Date']+pd.to_timedelta(resampling['Hour'],unit='h'))
 resampling['naive_forecast'] = resampling['Trips'].shift(24)
 resampling.dropna(inplace=True)
@@ -117,42 +99,34 @@ This allows the model to significantly reduce both average forecast error (MAE)
             """)
 resampling_data_for_sarimax = resampling.set_index('Date & Time')
 
-MODEL_PATH = r"C:\Users\Shaaf\Desktop\Data Science\Practice Projects\Transport Planning\Trasnport_planning-streamlit\models/sarimax_model.pkl"
-os.makedirs(os.path.dirname(MODEL_PATH), exist_ok=True)
-status = st.empty()
-
-if os.path.exists(MODEL_PATH):
-    status.success("✅ Loading the saved model...")
-    
-    with open(MODEL_PATH, "rb") as f:
-        sarimax_results = pickle.load(f)
-
-    time.sleep(3)   # optional: let user see it
-    status.empty()
-
-else:
-    status.info("⏳ Creating the SARIMA model (first run)...")
-
-    # Based on AUTO-ARIMA Model
-    order_best = (2, 0, 0)
-    seasonal_order_best = (1, 0, 1, 24)
-
-    sarimax_model = SARIMAX(
-        resampling_data_for_sarimax['Trips'],
-        order=order_best,
-        seasonal_order=seasonal_order_best,
-        enforce_stationarity=False,
-        enforce_invertibility=False
-    )
-
-    sarimax_results = sarimax_model.fit(disp=False)
-
-    with open(MODEL_PATH, "wb") as f:
-        pickle.dump(sarimax_results, f)
-
-    status.success("✅ SARIMA model trained and saved")
-    time.sleep(2)
-    status.empty()
+# Based on AUTO-ARIMA Model
+SARIMAX_PARAMS = {
+    'order': (2, 0, 0),
+    'seasonal_order': (1, 0, 1, 24),
+    'enforce_stationarity': False,
+    'enforce_invertibility': False,
+}
+# Models are versioned by the data they were trained on: new data trains a new version
+sarimax_fingerprint = data_fingerprint(resampling_data_for_sarimax['Trips'])
+sarimax_results, sarimax_metadata = load_model('sarimax', sarimax_fingerprint, SARIMAX_PARAMS)
+
+if sarimax_results is None:
+    def fit_sarimax():
+        sarimax_model = SARIMAX(resampling_data_for_sarimax['Trips'], **SARIMAX_PARAMS)
+        return sarimax_model.fit(disp=False)
+
+    def fitted_metrics(results):
+        return {
+            'mae': mean_absolute_error(resampling_data_for_sarimax['Trips'], results.fittedvalues),
+            'rmse': root_mean_squared_error(resampling_data_for_sarimax['Trips'], results.fittedvalues),
+        }
+
+    with st.spinner("⏳ Creating the SARIMA model (first run on this data)..."):
+        sarimax_results, sarimax_metadata = train_and_register(
+            'sarimax', fit_sarimax, sarimax_fingerprint, SARIMAX_PARAMS, evaluate=fitted_metrics
+        )
+
+st.caption(f"SARIMA model version {sarimax_metadata['version']}, trained {sarimax_metadata['trained_at']}")
 
 #assign a column to predicted values
 resampling_data_for_sarimax['Fitted'] = sarimax_results.fittedvalues
@@ -243,26 +217,23 @@ prophet_data = (resampling_data_for_sarimax.reset_index())
 prophet_data = prophet_data[['Date & Time','Trips']]
 prophet_data=prophet_data.rename(columns={'Date & Time':'ds','Trips':'y'})
 
-prophet_model_path = r"C:\Users\Shaaf\Desktop\Data Science\Practice Projects\Transport Planning\models\prophet_model.pkl"
-os.makedirs(os.path.dirname(prophet_model_path), exist_ok=True)
-status = st.empty()
-
-if os.path.exists(prophet_model_path):
-    status.success("✅ Loading the saved model...")
-    
-    with open(prophet_model_path, "rb") as f:
-        prophet_model = pickle.load(f)
+PROPHET_PARAMS = {}
+prophet_fingerprint = data_fingerprint(prophet_data)
+prophet_model, prophet_metadata = load_model('prophet', prophet_fingerprint, PROPHET_PARAMS)
 
-    time.sleep(3)   # optional: let user see it
-    status.empty()
+if prophet_model is None:
+    def fit_prophet():
+        model = Prophet(**PROPHET_PARAMS)
+        return model.fit(prophet_data)
 
-else:
-    status.info("⏳ Error:Prophet Model doesn't exists please create and run again!!)...")
+    with st.spinner("⏳ Creating the Prophet model (first run on this data)..."):
+        prophet_model, prophet_metadata = train_and_register(
+            'prophet', fit_prophet, prophet_fingerprint, PROPHET_PARAMS
+        )
 
-    time.sleep(2)
-    status.empty()
+st.caption(f"Prophet model version {prophet_metadata['version']}, trained {prophet_metadata['trained_at']}")
 
-future = prophet_model.make_future_dataframe(periods=0,freq='H')
+future = prophet_model.make_future_dataframe(periods=0,freq='h')
 prophet_forecast = prophet_model.predict(future)
 df_compare = resampling_data_for_sarimax.copy()
 df_compare['prophet_fitted'] = prophet_forecast['yhat'].values
@@ -376,8 +347,7 @@ Including these variables allows the model to test whether such external signals
 #To avoid streamlit load time the exogenous features where added in a separate file and loaded the resampled data directly
 @st.cache_data
 def load_exogenous_data():
-    path=r"C:\Users\Shaaf\Desktop\Data Science\Practice Projects\Transport Planning\Sampled_Data/sarimax_exogenous_Data_with_resample.csv"
-    df = pd.read_csv(path)
+    df = pd.read_csv(config.EXOGENOUS_DATA_PATH)
     return df
 data_exogenous = load_exogenous_data()
 data_exogenous.reset_index(drop=True,inplace=True)
@@ -455,71 +425,79 @@ This suggests that:
 
 st.subheader("XGBoost Model")
 
-df =data_exogenous.copy()
-##creating lags
-df['lag_1'] = df['Trips'].shift(1)
-df['lag_24'] = df['Trips'].shift(24)
-df['lag_168'] = df['Trips'].shift(168)  # weekly
-df['rolling_mean_24'] = df['Trips'].rolling(24).mean()
-df['rolling_std_24'] = df['Trips'].rolling(24).std()
-
-df['hour'] = df['tpep_pickup_datetime'].dt.hour
-df['dayofweek'] = df['tpep_pickup_datetime'].dt.dayofweek
-df['is_weekend'] = (df['dayofweek'] >= 5).astype(int)
-
-df = df.dropna()
-df.set_index('tpep_pickup_datetime',inplace=True)
-
-target = 'Trips'
-features = [
+XGB_FEATURES = [
     'lag_1', 'lag_24', 'lag_168',
     'rolling_mean_24', 'rolling_std_24',
     'hour', 'dayofweek', 'is_weekend',
     'temp', 'prcp', 'wspd',
     'is_holiday', 'is_festive_window'
 ]
+XGB_PARAMS = {
+    'n_estimators': 300,
+    'learning_rate': 0.05,
+    'max_depth': 6,
+    'subsample': 0.8,
+    'colsample_bytree': 0.8,
+    'objective': 'reg:squarederror',
+    'random_state': 42,
+    # Mid-year split for 2025-only data
+    'split_date': '2025-09-01',
+    'features': XGB_FEATURES,
+}
+
+def build_xgb_features(data_exogenous):
+    """Lag, rolling and calendar features of the hourly trips, indexed by pickup hour"""
+    df = data_exogenous.copy()
+    ##creating lags
+    df['lag_1'] = df['Trips'].shift(1)
+    df['lag_24'] = df['Trips'].shift(24)
+    df['lag_168'] = df['Trips'].shift(168)  # weekly
+    df['rolling_mean_24'] = df['Trips'].rolling(24).mean()
+    df['rolling_std_24'] = df['Trips'].rolling(24).std()
+
+    df['hour'] = df['tpep_pickup_datetime'].dt.hour
+    df['dayofweek'] = df['tpep_pickup_datetime'].dt.dayofweek
+    df['is_weekend'] = (df['dayofweek'] >= 5).astype(int)
+
+    df = df.dropna()
+    df.set_index('tpep_pickup_datetime',inplace=True)
+    return df
 
-X = df[features]
-y = df[target]
-
-split_date = pd.to_datetime('2025-09-01')  # Mid-year split for 2025-only data
-
-mask_train = X.index < split_date
-mask_test = X.index >= split_date
-
-X_train = X[mask_train].copy()
-X_test = X[mask_test].copy()
-y_train = y[mask_train].copy()
-y_test = y[mask_test].copy()
-
-
-from xgboost import XGBRegressor
-
-xgb_model = XGBRegressor(
-    n_estimators=300,
-    learning_rate=0.05,
-    max_depth=6,
-    subsample=0.8,
-    colsample_bytree=0.8,
-    objective='reg:squarederror',
-    random_state=42
-)
-
-xgb_model.fit(X_train, y_train)
-
-y_pred = xgb_model.predict(X_test)
-
-y_pred_series = pd.Series(
-    y_pred,
-    index=y_test.index,
-    name="XGBoost_Predicted"
-)
-y_pred = y_pred.ravel()
-y_pred = pd.Series(
-    y_pred,
-    index=y_test.index,
-    name="Predicted")
-y_pred =pd.DataFrame(y_pred,columns=['Predicted'])
+def train_xgboost(data_exogenous, params):
+    """
+    Train the booster once per dataset and hyperparameters: the model, its feature frame
+    and test predictions are registered together, so reruns only load them
+    """
+    df = build_xgb_features(data_exogenous)
+    X = df[params['features']]
+    y = df['Trips']
+    split_date = pd.to_datetime(params['split_date'])
+    model_params = {k: v for k, v in params.items() if k not in ('split_date', 'features')}
+
+    xgb_model = XGBRegressor(**model_params)
+    xgb_model.fit(X[X.index < split_date], y[X.index < split_date])
+    y_pred = pd.Series(xgb_model.predict(X[X.index >= split_date]).ravel(), index=X.index[X.index >= split_date], name='Predicted')
+    return {'model': xgb_model, 'features': df, 'predictions': y_pred}
+
+def prediction_metrics(bundle):
+    y_test = bundle['features'].loc[bundle['predictions'].index, 'Trips']
+    mse = mean_squared_error(y_test, bundle['predictions'])
+    return {'mae': mean_absolute_error(y_test, bundle['predictions']), 'mse': mse, 'rmse': np.sqrt(mse)}
+
+xgb_fingerprint = data_fingerprint(data_exogenous)
+xgb_bundle, xgb_metadata = load_model('xgboost', xgb_fingerprint, XGB_PARAMS)
+if xgb_bundle is None:
+    with st.spinner("⏳ Training the XGBoost model (first run on this data)..."):
+        xgb_bundle, xgb_metadata = train_and_register(
+            'xgboost', lambda: train_xgboost(data_exogenous, XGB_PARAMS), xgb_fingerprint, XGB_PARAMS,
+            evaluate=prediction_metrics
+        )
+
+xgb_model = xgb_bundle['model']
+df = xgb_bundle['features']
+y_pred = pd.DataFrame(xgb_bundle['predictions'])
+y_test = df.loc[y_pred.index, 'Trips']
+X_train = df.loc[df.index < pd.to_datetime(XGB_PARAMS['split_date']), XGB_FEATURES]
 results_df = pd.concat([y_test, y_pred], axis=1)
 
 fig4, ax4 = plt.subplots(figsize=(14,6))
@@ -554,9 +532,9 @@ ax4.legend(facecolor="black", labelcolor="white")
 ax4.grid(alpha=0.3)
 
 st.pyplot(fig4)
-xgb_mae = mean_absolute_error(y_test, y_pred)
-xgb_mse = mean_squared_error(y_test, y_pred)
-xgb_rmse = np.sqrt(mse)
+xgb_mae = xgb_metadata['metrics']['mae']
+xgb_mse = xgb_metadata['metrics']['mse']
+xgb_rmse = xgb_metadata['metrics']['rmse']
 
 print(f"XGBoost_MAE {xgb_mae:.2f}")
 print(f"XGBoost_MSE {xgb_mse:.2f}")
@@ -1,99 +1,64 @@
 import pandas as pd
 import streamlit as st
-import duckdb
 import numpy as np
 import plotly.express as px
 from datetime import datetime
 import warnings
 warnings.filterwarnings("ignore")
+from zones import load_zones
+from od_matrix import load_od_matrix
+from profit_table import load_profit_table
+from live_profit import MIN_LIVE_TRIPS, load_live_profit
+from recommendation import load_pickup_demand, load_travel_tensor, load_vendor_gaps, profit_per_minute
+from shift_planner import plan_shift, earning_rate
+from q_learning import ACTIONS, load_moves, load_q_table
+from zone_geometry import load_zone_neighbors
 
 # Page config
 st.set_page_config(page_title="NYC Taxi Route Optimizer", layout="wide", page_icon="🚕")
 
 # === STEP 1: LOAD REAL DATA ===
-@st.cache_data
 def load_and_prepare_data():
-    """Load real NYC taxi data"""
-    con = duckdb.connect(database=':memory:', read_only=False)
-    path = r"C:\Users\Shaaf\Desktop\Data Science\Practice Projects\Transport Planning\Sampled_Data\combined_sampled_data.parquet"
-    df = con.execute(f"SELECT * FROM '{path}'").df()
-    
-    # Clean data
-    df = df[df['total_amount'] > 0]
-    df = df[df['trip_distance'] <= 100]
-    df['pickup_hour'] = df['tpep_pickup_datetime'].dt.hour
-    df['Date'] = pd.to_datetime(df['tpep_pickup_datetime'].dt.date)
-    df = df[df['Date'].dt.year == 2025]
-    
-    return df
-
-# === STEP 2: CALCULATE PROFIT FROM REAL DATA ===
-def calculate_profit_by_zone_hour(df):
     """
-    Simple approach: For each zone and hour, calculate average profit
-    Profit = Revenue (fare + tip) - Costs (fuel based on distance)
+    Load real NYC taxi data: average profit and trip counts per zone, day of week and hour,
+    published once per data version and memory-mapped read-only by every session
     """
-    FUEL_COST_PER_MILE = 0.60
-    
-    # Calculate profit for each trip
-    df['revenue'] = df['fare_amount'] + df.get('tip_amount', 0).fillna(0)
-    df['cost'] = df['trip_distance'] * FUEL_COST_PER_MILE
-    df['profit'] = df['revenue'] - df['cost']
-    
-    # Group by pickup zone and hour to find average profit
-    profit_summary = df.groupby(['PULocationID', 'pickup_hour']).agg({
-        'profit': 'mean',
-        'PULocationID': 'count'  # Count trips
-    }).rename(columns={'PULocationID': 'trip_count'})
-    
-    return profit_summary
+    return load_profit_table(2025)
 
-# === STEP 3: CREATE SIMPLE RECOMMENDATION TABLE ===
-def create_recommendation_table(profit_summary):
+# === STEP 2: FIND BEST NEARBY ZONES ===
+def get_nearby_zones(current_zone, k=10):
     """
-    Convert profit data into a simple lookup table
-    For each zone and hour, we know the average profit
+    Get nearby zones from the taxi-zone map: the zones bordering the current one,
+    topped up with the zones whose centres are closest until there are `k`
     """
-    # Create a table: rows=zones, columns=hours
-    zones = range(266)
-    hours = range(24)
-    
-    recommendation_table = np.zeros((266, 24))
-    
-    for zone in zones:
-        for hour in hours:
-            try:
-                # Get average profit for this zone-hour combination
-                profit = profit_summary.loc[(zone, hour), 'profit']
-                recommendation_table[zone, hour] = profit
-            except:
-                # If no data exists, set to 0
-                recommendation_table[zone, hour] = 0
-    
-    return recommendation_table
+    return load_zone_neighbors().nearby(current_zone, k).tolist()
 
-# === STEP 4: FIND BEST NEARBY ZONES ===
-def get_nearby_zones(current_zone):
-    """
-    Get nearby zones (simple adjacency based on zone numbers)
-    In reality, you'd use geographic coordinates
-    """
-    nearby = []
-    for offset in [-5, -4, -3, -2, -1, 1, 2, 3, 4, 5]:
-        neighbor = current_zone + offset
-        if 0 <= neighbor < 266:
-            nearby.append(neighbor)
-    return nearby
+DAY_NAMES = ["Any day", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
 
 # Load data
 with st.spinner("Loading real NYC taxi data..."):
     data = load_and_prepare_data()
-    profit_summary = calculate_profit_by_zone_hour(data)
-    recommendation_table = create_recommendation_table(profit_summary)
 
-# Store in session state
-if 'rec_table' not in st.session_state:
-    st.session_state.rec_table = recommendation_table
+selected_day = st.sidebar.selectbox("Day of the week", DAY_NAMES, index=0)
+# Average profit per trip (Profit = Revenue (fare + tips) - fuel costs) and trip counts,
+# rows=zones, columns=hours, 0 where there is no data; one day of the week (Monday = 0) unless "Any day"
+recommendation_table, trip_counts = data.day(None if selected_day == DAY_NAMES[0] else DAY_NAMES.index(selected_day) - 1)
+
+# Live profit from the streaming trip events, when a live source is configured
+live = load_live_profit()
+PROFIT_SOURCES = ["Historical average", "Live: last hour", "Live: decayed"]
+profit_source = st.sidebar.radio(
+    "Profit source", PROFIT_SOURCES, index=0, disabled=live is None,
+    help="Live values are fed by the trip events dropped in TRANSPORT_LIVE_EVENTS"
+)
+live_trips = None
+if live is not None and profit_source != PROFIT_SOURCES[0]:
+    snapshot = live.snapshot()
+    key = 'window' if profit_source == PROFIT_SOURCES[1] else 'decayed'
+    live_trips = snapshot[f'{key}_trips']
+    # Zones and hours with too few (or, decayed, too old) live trips keep their historical average
+    live_cells = live_trips >= MIN_LIVE_TRIPS
+    recommendation_table = np.where(live_cells, snapshot[f'{key}_profit'], recommendation_table)
 
 # === INTERFACE ===
 st.title("🚕 NYC Taxi Profit Analyzer")
@@ -105,23 +70,18 @@ It calculates: **Profit = (Fare + Tips) - (Fuel Costs)**
 # Show data stats
 col_info1, col_info2, col_info3 = st.columns(3)
 with col_info1:
-    st.metric("Total Trips Analyzed", f"{len(data):,}")
+    st.metric("Total Trips Analyzed", f"{data.metadata['trips']:,}")
 with col_info2:
-    avg_profit = data['profit'].mean()
+    avg_profit = data.metadata['profit'] / max(data.metadata['trips'], 1)
     st.metric("Average Profit per Trip", f"${avg_profit:.2f}")
 with col_info3:
     st.metric("Data Year", "2025")
 
 st.markdown("---")
 
-# Zone names
-ZONE_NAMES = {
-    161: "Midtown Center", 162: "Midtown East", 163: "Midtown North",
-    164: "Midtown South", 230: "Times Square", 237: "Upper East Side",
-    238: "Upper West Side", 142: "Lincoln Square", 170: "Murray Hill",
-    186: "Penn Station", 79: "East Village", 100: "Garment District",
-    113: "Greenwich Village", 132: "JFK Airport", 138: "LaGuardia Airport",
-}
+# Zone names, boroughs and service zones for all 265 TLC zones, indexed by LocationID
+zones = load_zones()
+DEFAULT_ZONE = 161  # Midtown Center
 
 # === USER INPUT ===
 col1, col2 = st.columns([1, 1])
@@ -130,11 +90,12 @@ with col1:
     st.subheader("📍 Select Location & Time")
     
     # Zone selection
-    zone_options = {f"{k} - {v}": k for k, v in ZONE_NAMES.items()}
+    zone_ids = zones.ids()
+    zone_options = dict(zip(zones.labels(zone_ids), zone_ids.tolist()))
     selected_zone_name = st.selectbox(
         "Where are you now?",
         options=list(zone_options.keys()),
-        index=0
+        index=int(np.searchsorted(zone_ids, DEFAULT_ZONE)) if DEFAULT_ZONE in zone_ids else 0
     )
     selected_zone = zone_options[selected_zone_name]
     
@@ -147,21 +108,50 @@ with col2:
     st.subheader("💰 Expected Profit")
     
     # Get profit for this zone and hour
-    expected_profit = st.session_state.rec_table[selected_zone, selected_hour]
+    expected_profit = recommendation_table[selected_zone, selected_hour]
     
     if expected_profit > 0:
         st.success(f"### ${expected_profit:.2f}")
-        st.caption("Average profit per trip based on historical data")
-        
-        # Show historical trip count
-        try:
-            trip_count = profit_summary.loc[(selected_zone, selected_hour), 'trip_count']
-            st.info(f"Based on **{int(trip_count)}** historical trips")
-        except:
-            st.info("Limited historical data for this zone/hour")
+        if live_trips is not None and live_cells[selected_zone, selected_hour]:
+            st.caption(f"Average profit per trip from live trip events ({profit_source.split(': ')[1]})")
+            if key == 'window':
+                st.info(f"Based on **{int(live_trips[selected_zone, selected_hour])}** live trips")
+            else:
+                st.info(f"Based on **{live_trips[selected_zone, selected_hour]:.1f}** live trips, weighted by age")
+        else:
+            st.caption("Average profit per trip based on historical data")
+
+            # Show historical trip count
+            st.info(f"Based on **{int(trip_counts[selected_zone, selected_hour])}** historical trips")
     else:
         st.warning("⚠️ No historical data for this zone/hour")
 
+    # Shown for context only: the data has no cab key, so this pools every cab of a vendor
+    vendor_gap = load_vendor_gaps(2025)[selected_hour, selected_zone]
+    if np.isfinite(vendor_gap):
+        st.caption(f"Vendor throughput gap here: {vendor_gap:.1f} min between consecutive trips of the same "
+                   "vendor (all of its cabs pooled, so not a driver's wait for a fare)")
+
+    if live is not None:
+        @st.fragment(run_every=1.0)
+        def show_live_profit(zone, hour):
+            """Live profit of the selected zone and hour, refreshed every second on its own"""
+            snapshot = live.snapshot()
+            if snapshot['watermark'] is None:
+                st.caption("📡 Waiting for live trip events...")
+                return
+            live_col1, live_col2 = st.columns(2)
+            live_col1.metric("Live: last hour", f"${snapshot['window_profit'][zone, hour]:.2f}",
+                             f"{int(snapshot['window_trips'][zone, hour])} trips", delta_color="off")
+            live_col2.metric("Live: decayed", f"${snapshot['decayed_profit'][zone, hour]:.2f}",
+                             f"{snapshot['decayed_trips'][zone, hour]:.1f} weighted trips", delta_color="off")
+            idle = (f", no new events for {snapshot['idle_seconds'] / 60:.0f} min (live values fading)"
+                    if snapshot['idle_seconds'] >= 60 else "")
+            st.caption(f"📡 {snapshot['events']:,} live events, latest pickup "
+                       f"{pd.Timestamp(snapshot['watermark'], unit='s'):%Y-%m-%d %H:%M:%S}{idle}")
+
+        show_live_profit(selected_zone, selected_hour)
+
 # === RECOMMENDATION: WHERE TO GO NEXT ===
 st.markdown("---")
 st.subheader("🎯 Recommendation: Where Should You Go Next?")
@@ -170,33 +160,38 @@ st.subheader("🎯 Recommendation: Where Should You Go Next?")
 nearby_zones = get_nearby_zones(selected_zone)
 next_hour = (selected_hour + 1) % 24  # Next hour (wraps to 0 after 23)
 
-nearby_recommendations = []
-for zone in nearby_zones:
-    profit = st.session_state.rec_table[zone, next_hour]
-    zone_name = ZONE_NAMES.get(zone, f"Zone {zone}")
-    nearby_recommendations.append({
-        'Zone ID': zone,
-        'Zone Name': zone_name,
-        'Expected Profit ($)': profit
-    })
-
-# Sort by profit (highest first)
-nearby_df = pd.DataFrame(nearby_recommendations).sort_values('Expected Profit ($)', ascending=False)
+# Rank by profit per minute once the empty drive there (time and fuel) is paid for
+travel = load_travel_tensor(2025)
+candidates = [selected_zone] + nearby_zones
+drive_minutes, drive_miles, per_minute = profit_per_minute(
+    selected_zone, candidates, selected_hour, recommendation_table[:, next_hour], travel, trip_hour=next_hour
+)
+ranked_df = pd.DataFrame({
+    'Zone ID': candidates,
+    'Zone Name': zones.names(candidates),
+    'Expected Profit ($)': recommendation_table[candidates, next_hour],
+    'Drive (min)': drive_minutes,
+    'Net Profit per Minute ($)': per_minute,
+})
+current_zone_per_minute = ranked_df['Net Profit per Minute ($)'].iloc[0]
+
+# Sort by net profit per minute (highest first)
+nearby_df = ranked_df.iloc[1:].sort_values('Net Profit per Minute ($)', ascending=False)
 
 # Show top 3 recommendations
 col_r1, col_r2, col_r3 = st.columns(3)
 
-if len(nearby_df) > 0 and nearby_df.iloc[0]['Expected Profit ($)'] > 0:
+if len(nearby_df) > 0 and nearby_df.iloc[0]['Net Profit per Minute ($)'] > 0:
     # Best recommendation
     with col_r1:
         best = nearby_df.iloc[0]
         st.success("**🥇 Best Choice**")
         st.metric(
             best['Zone Name'],
-            f"${best['Expected Profit ($)']:.2f}",
+            f"${best['Net Profit per Minute ($)']:.2f}/min",
             delta="Highest Profit"
         )
-        st.caption(f"Zone {best['Zone ID']} at {next_hour:02d}:00")
+        st.caption(f"Zone {best['Zone ID']} at {next_hour:02d}:00 · {best['Drive (min)']:.0f} min drive · ${best['Expected Profit ($)']:.2f}/trip")
     
     # Second best
     with col_r2:
@@ -205,9 +200,9 @@ if len(nearby_df) > 0 and nearby_df.iloc[0]['Expected Profit ($)'] > 0:
             st.info("**🥈 Alternative**")
             st.metric(
                 second['Zone Name'],
-                f"${second['Expected Profit ($)']:.2f}"
+                f"${second['Net Profit per Minute ($)']:.2f}/min"
             )
-            st.caption(f"Zone {second['Zone ID']} at {next_hour:02d}:00")
+            st.caption(f"Zone {second['Zone ID']} at {next_hour:02d}:00 · {second['Drive (min)']:.0f} min drive · ${second['Expected Profit ($)']:.2f}/trip")
     
     # Third best
     with col_r3:
@@ -216,21 +211,54 @@ if len(nearby_df) > 0 and nearby_df.iloc[0]['Expected Profit ($)'] > 0:
             st.info("**🥉 Backup Option**")
             st.metric(
                 third['Zone Name'],
-                f"${third['Expected Profit ($)']:.2f}"
+                f"${third['Net Profit per Minute ($)']:.2f}/min"
             )
-            st.caption(f"Zone {third['Zone ID']} at {next_hour:02d}:00")
+            st.caption(f"Zone {third['Zone ID']} at {next_hour:02d}:00 · {third['Drive (min)']:.0f} min drive · ${third['Expected Profit ($)']:.2f}/trip")
     
-    # Decision helper
-    current_zone_next_hour = st.session_state.rec_table[selected_zone, next_hour]
-    best_nearby_profit = nearby_df.iloc[0]['Expected Profit ($)']
+    # Decision helper: staying costs no empty drive
+    best_nearby_per_minute = nearby_df.iloc[0]['Net Profit per Minute ($)']
     
-    if best_nearby_profit > current_zone_next_hour * 1.2:  # 20% better
-        st.success(f"💡 **Recommendation: Move to {nearby_df.iloc[0]['Zone Name']}** - It's {((best_nearby_profit/current_zone_next_hour - 1)*100):.0f}% more profitable!")
+    if best_nearby_per_minute > current_zone_per_minute * 1.2:  # 20% better
+        gain = (f"It's {((best_nearby_per_minute/current_zone_per_minute - 1)*100):.0f}% more profitable per minute, drive included!"
+                if current_zone_per_minute > 0 else "Your current zone has no profitable trips at that hour.")
+        st.success(f"💡 **Recommendation: Move to {nearby_df.iloc[0]['Zone Name']}** - {gain}")
     else:
-        st.info(f"💡 **Recommendation: Stay in current zone** - Nearby zones aren't significantly better")
+        st.info(f"💡 **Recommendation: Stay in current zone** - Nearby zones aren't significantly better once the drive is counted")
+elif not nearby_zones:
+    # Zones without geometry on the taxi-zone map (e.g. 264/265, unknown) have no neighbours
+    st.info("📍 This zone has no neighbouring zones on the map to compare with")
 else:
     st.warning("⚠️ Limited data for nearby zones at the next hour")
 
+# === SHIFT PLAN: THE WHOLE SHIFT, NOT JUST THE NEXT HOUR ===
+st.markdown("---")
+st.subheader("🗓️ Shift Planner")
+shift_hours = st.slider("Shift length (hours)", 1, 12, 8, 1)
+
+plan = plan_shift(
+    selected_zone, selected_hour, shift_hours,
+    earning_rate(recommendation_table, trip_counts, load_pickup_demand(2025), travel), travel, load_od_matrix(2025)
+)
+st.metric("Expected Shift Earnings", f"${plan.expected_total:,.2f}")
+st.dataframe(pd.DataFrame({
+    'Time': [f"{hour:02d}:00" for hour in plan.hours],
+    'Starting In': zones.names(plan.origins),
+    'Work In': zones.names(plan.zones),
+    'Drive (min)': plan.drive_minutes.round(0),
+    'Expected Earnings ($)': plan.earnings.round(2),
+}), hide_index=True, use_container_width=True)
+st.caption("Each hour: drive to the zone to work in, then take trips there. Where the trips end is "
+           "uncertain, so later rows start from the most likely drop-off zone.")
+
+# === LEARNED POLICY (trained offline with q_learning.py) ===
+q_table = load_q_table()
+if q_table is not None:
+    q_values = q_table[selected_zone, selected_hour]
+    learned_action = int(q_values.argmax())
+    learned_zone = load_moves()[selected_zone, learned_action]
+    move_text = "stay where you are" if learned_zone == selected_zone else f"head {ACTIONS[learned_action].lower()} to {zones.name[learned_zone]}"
+    st.info(f"🤖 **Learned policy**: {move_text} (Q-value {q_values[learned_action]:.1f})")
+
 # === COMPARISON CHARTS ===
 st.markdown("---")
 st.subheader(f"📊 Profit Analysis for Zone {selected_zone}")
@@ -238,7 +266,7 @@ st.subheader(f"📊 Profit Analysis for Zone {selected_zone}")
 # Chart 1: Profit throughout the day
 hourly_profits = []
 for hour in range(24):
-    profit = st.session_state.rec_table[selected_zone, hour]
+    profit = recommendation_table[selected_zone, hour]
     hourly_profits.append({
         'Hour': f"{hour:02d}:00",
         'Hour_num': hour,
@@ -251,7 +279,7 @@ fig_hourly = px.line(
     hourly_df,
     x='Hour',
     y='Expected Profit ($)',
-    title=f'Expected Profit Throughout the Day - {ZONE_NAMES.get(selected_zone, f"Zone {selected_zone}")}',
+    title=f'Expected Profit Throughout the Day - {zones.name[selected_zone]}',
     markers=True
 )
 fig_hourly.add_vline(x=selected_hour, line_dash="dash", line_color="red", 
@@ -262,15 +290,13 @@ st.plotly_chart(fig_hourly, use_container_width=True)
 # Chart 2: Compare different zones at current time
 st.subheader(f"🗺️ Compare Zones at {time_label}")
 
-comparison_data = []
-for zone_id, zone_name in ZONE_NAMES.items():
-    profit = st.session_state.rec_table[zone_id, selected_hour]
-    comparison_data.append({
-        'Zone': zone_name,
-        'Expected Profit ($)': profit
-    })
-
-comp_df = pd.DataFrame(comparison_data).sort_values('Expected Profit ($)', ascending=False)
+# The 15 most profitable of all zones at this hour
+zone_profits = recommendation_table[zone_ids, selected_hour]
+top_zones = zone_ids[np.argsort(zone_profits)[::-1][:15]]
+comp_df = pd.DataFrame({
+    'Zone': zones.names(top_zones),
+    'Expected Profit ($)': recommendation_table[top_zones, selected_hour],
+})
 
 fig_zones = px.bar(
     comp_df,
@@ -283,39 +309,53 @@ fig_zones = px.bar(
 fig_zones.update_layout(height=400, xaxis_tickangle=-45)
 st.plotly_chart(fig_zones, use_container_width=True)
 
+# Where trips picked up here at this hour usually go
+st.subheader(f"🧭 Popular Trips from {zones.name[selected_zone]} at {time_label}")
+od = load_od_matrix(2025)
+destinations, trips = od.top_destinations(5, hour=selected_hour, origin=selected_zone)
+if len(destinations) > 0:
+    st.dataframe(pd.DataFrame({
+        'Destination': zones.names(destinations),
+        'Trips': trips,
+        'Median Fare ($)': od.median('fare_amount', selected_hour)[selected_zone, destinations].round(2),
+        'Median Duration (min)': (od.median('duration_seconds', selected_hour)[selected_zone, destinations] / 60).round(1),
+    }), hide_index=True, use_container_width=True)
+else:
+    st.info("No historical trips from this zone at this hour")
+
 # === INSIGHTS SECTION ===
 st.markdown("---")
 st.subheader("💡 Key Insights")
 
 # Find best zone and hour overall
 best_zone_idx, best_hour_idx = np.unravel_index(
-    st.session_state.rec_table.argmax(), 
-    st.session_state.rec_table.shape
+    recommendation_table.argmax(), 
+    recommendation_table.shape
 )
-best_profit = st.session_state.rec_table[best_zone_idx, best_hour_idx]
+best_profit = recommendation_table[best_zone_idx, best_hour_idx]
 
 col_i1, col_i2, col_i3 = st.columns(3)
 
 with col_i1:
     st.metric(
         "Most Profitable Zone", 
-        ZONE_NAMES.get(best_zone_idx, f"Zone {best_zone_idx}"),
+        zones.name[best_zone_idx],
         delta=f"${best_profit:.2f}"
     )
 
 with col_i2:
     # Best hour for current zone
-    best_hour_current = np.argmax(st.session_state.rec_table[selected_zone, :])
-    best_profit_current = st.session_state.rec_table[selected_zone, best_hour_current]
+    best_hour_current = np.argmax(recommendation_table[selected_zone, :])
+    best_profit_current = recommendation_table[selected_zone, best_hour_current]
     st.metric(
-        f"Best Time for {ZONE_NAMES.get(selected_zone, 'Current Zone')}", 
+        f"Best Time for {zones.name[selected_zone]}", 
         f"{best_hour_current:02d}:00",
         delta=f"${best_profit_current:.2f}"
     )
 
 with col_i3:
     # Current vs best comparison
-    current_profit = st.session_state.rec_table[selected_zone, selected_hour]
+    current_profit = recommendation_table[selected_zone, selected_hour]
     if best_profit_current > 0:
         efficiency = (current_profit / best_profit_current) * 100
         st.metric(
@@ -339,11 +379,14 @@ with st.expander("ℹ️ How This Works (For Interview)"):
     3. **Pattern Analysis**: Group trips by zone and hour, calculate average profit
     
     4. **Recommendation Logic**: 
-       - Look at nearby zones (±5 zone IDs)
-       - Check their profit in the next hour
-       - Recommend the most profitable option
+       - Look at nearby zones (bordering zones, plus the closest ones on the map)
+       - Check their profit in the next hour, less the time and fuel of driving there empty
+       - Recommend the option with the highest net profit per minute
        - Compare: Is moving worth it vs staying?
     
+    5. **Shift Planning**: Work backwards from the end of the shift, hour by hour, to find
+       the zone to work in each hour that maximizes the expected earnings of the whole shift
+    
     ### Why It's Useful:
     - Drivers can see which areas make the most money
     - They get actionable recommendations: "Go to Times Square" or "Stay here"
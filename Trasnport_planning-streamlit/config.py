@@ -0,0 +1,50 @@
+import os
+
+# Every location can be overridden through an environment variable, so the app and the
+# ingestion script run outside the original workstation without code changes.
+PROJECT_DIR = os.environ.get(
+    'TRANSPORT_PROJECT_DIR', r"C:\Users\Shaaf\Desktop\Data Science\Practice Projects\Transport Planning"
+)
+RAW_DATA_DIR = os.environ.get('TRANSPORT_RAW_DATA_DIR', os.path.join(PROJECT_DIR, 'Data'))
+SAMPLED_DATA_DIR = os.environ.get('TRANSPORT_SAMPLED_DATA_DIR', os.path.join(PROJECT_DIR, 'Sampled_Data'))
+
+# Datasets written by Data_Processing under SAMPLED_DATA_DIR
+DATASET_DIR = "combined_sampled_data"
+CLEANED_DIR = "cleaned_trips"
+CUBE_DIR = "trip_cube"
+# Trips per (Date, VendorID), rolled up apart so the vendor key doesn't multiply the cube
+VENDOR_CUBE_DIR = "vendor_cube"
+# Gaps between a vendor's consecutive trips (all of its cabs pooled: throughput, not a
+# driver's wait), computed from the full (unsampled) months
+IDLE_DIR = "idle_stats"
+REPOSITION_DIR = "reposition_flows"
+MANIFEST_FILE = "manifest.json"
+# Per-month origin-destination partials kept by od_matrix
+OD_MATRIX_DIR = "od_matrix"
+# Versioned, memory-mapped profit tables shared by every session and worker process
+PROFIT_TABLE_DIR = "profit_table"
+
+# Reference data and derived files
+ZONE_LOOKUP_PATH = os.environ.get('TRANSPORT_ZONE_LOOKUP', os.path.join(SAMPLED_DATA_DIR, 'taxi_zone_lookup.csv'))
+ZONES_GEOJSON_PATH = os.environ.get('TRANSPORT_ZONES_GEOJSON', os.path.join(SAMPLED_DATA_DIR, 'NYC Taxi Zones.geojson'))
+# Simplification tolerance of the zone polygons drawn on maps, in degrees (~10 m)
+ZONE_SIMPLIFY_TOLERANCE = float(os.environ.get('TRANSPORT_ZONE_SIMPLIFY_TOLERANCE', 0.0001))
+EXOGENOUS_DATA_PATH = os.environ.get(
+    'TRANSPORT_EXOGENOUS_DATA', os.path.join(SAMPLED_DATA_DIR, 'sarimax_exogenous_Data_with_resample.csv')
+)
+# Trained forecasting models, versioned by the data and hyperparameters they were trained on
+MODEL_REGISTRY_DIR = os.environ.get('TRANSPORT_MODEL_REGISTRY', os.path.join(PROJECT_DIR, 'models', 'registry'))
+# Live trip events for the streaming profit aggregates: a directory of parquet drops or a JSON-lines file
+LIVE_EVENTS_PATH = os.environ.get('TRANSPORT_LIVE_EVENTS', os.path.join(SAMPLED_DATA_DIR, 'live_events'))
+Q_TABLE_PATH = os.environ.get('TRANSPORT_Q_TABLE', os.path.join(SAMPLED_DATA_DIR, 'q_table.npz'))
+
+# Running cost charged per mile driven, paid or empty
+FUEL_COST_PER_MILE = float(os.environ.get('TRANSPORT_FUEL_COST_PER_MILE', 0.60))
+
+# Persistent DuckDB catalog holding the views the pages query
+CATALOG_PATH = os.environ.get('TRANSPORT_CATALOG', os.path.join(SAMPLED_DATA_DIR, 'transport.duckdb'))
+
+
+def dataset_glob(name):
+    """Glob matching every file of a Hive-partitioned dataset under SAMPLED_DATA_DIR."""
+    return os.path.join(SAMPLED_DATA_DIR, name, '**', '*.parquet')
@@ -0,0 +1,174 @@
+import logging
+import duckdb
+import pandas as pd
+import streamlit as st
+import config
+
+logger = logging.getLogger(__name__)
+
+def _parquet_view(dataset_dir):
+    glob = config.dataset_glob(dataset_dir)
+    return f"SELECT * FROM read_parquet('{glob}', hive_partitioning=true, union_by_name=true)"
+
+
+# Views the catalog exposes: the datasets written by Data_Processing and the zone lookup
+VIEWS = {
+    'sampled_trips': _parquet_view(config.DATASET_DIR),
+    # Cleaned layer: filtered, nulls filled, with Date/Hour/DayOfWeek/profit
+    'trips': _parquet_view(config.CLEANED_DIR),
+    # Trip cube: counts and sums per (Date, Hour, PU, DO)
+    'trip_cube': _parquet_view(config.CUBE_DIR),
+    # Trip counts per (Date, VendorID)
+    'vendor_cube': _parquet_view(config.VENDOR_CUBE_DIR),
+    # Vendor throughput gaps per (PU, Hour) and zone-to-zone moves between a vendor's
+    # consecutive trips, from the unsampled months (descriptive only, no cab key)
+    'idle_stats': _parquet_view(config.IDLE_DIR),
+    'reposition_flows': _parquet_view(config.REPOSITION_DIR),
+    'zones': f"SELECT * FROM read_csv('{config.ZONE_LOOKUP_PATH}', header=true)",
+}
+
+# Compact storage type of every TLC column a page may ask for: zone IDs fit in int16,
+# money and distances in float32, codes and flags become pandas categoricals.
+COLUMN_TYPES = {
+    'VendorID': 'SMALLINT',
+    'tpep_pickup_datetime': 'TIMESTAMP',
+    'tpep_dropoff_datetime': 'TIMESTAMP',
+    'passenger_count': 'FLOAT',
+    'trip_distance': 'FLOAT',
+    'RatecodeID': 'SMALLINT',
+    'store_and_fwd_flag': 'VARCHAR',
+    'PULocationID': 'SMALLINT',
+    'DOLocationID': 'SMALLINT',
+    'payment_type': 'SMALLINT',
+    'fare_amount': 'FLOAT',
+    'extra': 'FLOAT',
+    'mta_tax': 'FLOAT',
+    'tip_amount': 'FLOAT',
+    'tolls_amount': 'FLOAT',
+    'improvement_surcharge': 'FLOAT',
+    'total_amount': 'FLOAT',
+    'congestion_surcharge': 'FLOAT',
+    'Airport_fee': 'FLOAT',
+    'cbd_congestion_fee': 'FLOAT',
+    'Date': 'DATE',
+    'Hour': 'TINYINT',
+    'DayOfWeek': 'TINYINT',
+    'profit': 'FLOAT',
+}
+CATEGORICAL_COLUMNS = {'VendorID', 'RatecodeID', 'store_and_fwd_flag', 'payment_type'}
+
+# Rows per record batch when streaming large results
+BATCH_SIZE = 128 * 1024
+
+
+def build_catalog(catalog_path=config.CATALOG_PATH):
+    """
+    Create or refresh the views of the persistent catalog.
+
+    Views over datasets that don't exist yet are skipped. If another process already
+    holds the catalog open, its views are in place and nothing is done.
+    """
+    try:
+        con = duckdb.connect(catalog_path)
+    except duckdb.IOException:
+        return
+    try:
+        for name, source in VIEWS.items():
+            try:
+                con.execute(f"CREATE OR REPLACE VIEW {name} AS {source}")
+            except duckdb.IOException as e:
+                logger.warning(f"Skipping view '{name}': {e}")
+    finally:
+        con.close()
+
+
+@st.cache_resource
+def get_connection():
+    """One read-only catalog connection per server process, shared by every session."""
+    build_catalog()
+    return duckdb.connect(config.CATALOG_PATH, read_only=True)
+
+
+def query_arrow(sql, params=None):
+    """Run `sql` against the catalog on its own cursor (safe across session threads) as an Arrow table."""
+    with get_connection().cursor() as cur:
+        return cur.execute(sql, params).fetch_arrow_table()
+
+
+def query_batches(sql, params=None, batch_size=BATCH_SIZE):
+    """
+    Stream the result of `sql` as a pyarrow RecordBatchReader, for results too large to
+    hold at once. The reader keeps its cursor alive until it is exhausted.
+    """
+    return get_connection().cursor().execute(sql, params).fetch_record_batch(batch_size)
+
+
+def query(sql, params=None, dtype_backend='pyarrow'):
+    """
+    Run `sql` and return a DataFrame.
+
+    With the default 'pyarrow' backend the columns are pd.ArrowDtype views over the
+    Arrow result buffers, so no per-column copy or Python string objects are made.
+    Use 'numpy' for code that needs NumPy-backed columns (statsmodels, Prophet, ...);
+    DATE columns then come back as datetime64, not objects holding datetime.date.
+    """
+    table = query_arrow(sql, params)
+    if dtype_backend == 'pyarrow':
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    return table.to_pandas(date_as_object=False)
+
+
+@st.cache_data
+def cached_query(sql, params=None, dtype_backend='pyarrow'):
+    """query() whose small result is cached per SQL text, for chart-sized aggregates."""
+    return query(sql, params, dtype_backend)
+
+
+def load_trips(columns, where=None):
+    """
+    Load only `columns` of the cleaned trips, cast to their compact types.
+
+    `where` is an optional SQL predicate evaluated by DuckDB during the scan, so
+    partition (year, month) and pickup-time filters prune files and row groups.
+    """
+    select = ",\n".join(f'CAST("{c}" AS {COLUMN_TYPES[c]}) AS "{c}"' for c in columns)
+    sql = f"SELECT {select}\nFROM trips"
+    if where:
+        sql += f"\nWHERE {where}"
+
+    df = query(sql, dtype_backend='numpy')
+    for column in CATEGORICAL_COLUMNS.intersection(columns):
+        df[column] = df[column].astype('category')
+    return df
+
+
+def summarize_cube(by, measures, where=None, dtype_backend='pyarrow'):
+    """
+    Roll the trip cube up to the `by` columns, summing `measures`, ordered by `by`.
+
+    `by` may hold cube keys or SQL expressions over them (e.g. "dayofweek(Date) AS dow");
+    trip_count comes back as int64 and every other measure as float64.
+    """
+    select = [*by] + [
+        f'CAST(SUM("{m}") AS {"BIGINT" if m == "trip_count" else "DOUBLE"}) AS "{m}"' for m in measures
+    ]
+    sql = f"SELECT {', '.join(select)}\nFROM trip_cube"
+    if where:
+        sql += f"\nWHERE {where}"
+    if by:
+        sql += "\nGROUP BY ALL ORDER BY ALL"
+    return query(sql, dtype_backend=dtype_backend)
+
+
+def year_filter(year, time_column='tpep_pickup_datetime'):
+    """
+    Predicate keeping rows of `year`, prunable by partition and row group.
+
+    Only the `year` partitions are read. Pickups of `year` filed in another year's
+    month (a New Year's Eve trip in the January file) are left out on purpose; ingestion
+    drops them from the cleaned layer anyway (see Data_Processing.clean_month).
+    """
+    return (
+        f"year = {int(year)} AND {time_column} >= '{int(year)}-01-01' "
+        f"AND {time_column} < '{int(year) + 1}-01-01'"
+    )
@@ -0,0 +1,163 @@
+import time
+import argparse
+import logging
+from dataclasses import dataclass
+import numpy as np
+import streamlit as st
+from data_access import year_filter
+from zones import N_ZONES
+from od_matrix import N_HOURS, load_od_matrix
+from zone_geometry import load_zone_neighbors
+from recommendation import load_pickup_demand, load_profit_tensor, load_travel_tensor, profit_per_minute
+
+logger = logging.getLogger(__name__)
+
+# Destinations considered per driver: the current zone and its nearest neighbours
+N_CANDIDATES = 11
+
+
+@dataclass(frozen=True)
+class FleetRecommender:
+    """
+    Precomputed next-zone scores for batch recommendations to a whole fleet.
+
+    `candidates` (zone, N_CANDIDATES) lists the current zone then its nearby zones (-1
+    pads short rows); `scores` (hour, zone, N_CANDIDATES) is the net profit per minute of
+    each candidate, drive included, like the Route Recommendation page; `demand` (hour,
+    zone) is the expected number of pickups per hour. A query is then a gather plus a
+    few sorts, with no per-driver Python.
+    """
+    candidates: np.ndarray
+    scores: np.ndarray
+    demand: np.ndarray
+
+    def recommend(self, zones, hours, k=3, supply=None, share=1.0, random_state=0):
+        """
+        Top-`k` destinations for N drivers at `zones` and `hours`, as (N, k) arrays of
+        LocationIDs and scores (-1 / -inf where a driver has fewer options).
+
+        The first destination spreads drivers out: each (hour, zone) takes at most
+        `share` x its expected pickups, less `supply` (drivers already heading there,
+        shape (hour, zone)). Drivers with the best score there go first; the others fall
+        back to their next-best candidate. Drivers left over once all their candidates
+        are full are spread over them in proportion to demand. The remaining columns
+        follow in score order.
+        """
+        zones = np.asarray(zones, dtype=np.int64)
+        hours = np.asarray(hours, dtype=np.int64)
+        n = len(zones)
+        scores = self.scores[hours, zones]
+        order = np.argsort(-scores, axis=1, kind='stable')
+        preferred = np.take_along_axis(self.candidates[zones], order, axis=1).astype(np.int64)
+        preferred_scores = np.take_along_axis(scores, order, axis=1)
+
+        remaining = share * self.demand.ravel()
+        if supply is not None:
+            remaining = remaining - np.asarray(supply, dtype=np.float64).ravel()
+        choice = np.zeros(n, dtype=np.int64)
+        assigned = np.full(n, -1, dtype=np.int64)
+        overflow = []
+        active = np.flatnonzero(np.isfinite(preferred_scores[:, 0]))
+        while len(active):
+            zone = preferred[active, choice[active]]
+            key = hours[active] * N_ZONES + zone
+            ranked = np.lexsort((-preferred_scores[active, choice[active]], key))
+            ranked_keys = key[ranked]
+            position = np.arange(len(ranked)) - np.searchsorted(ranked_keys, ranked_keys)
+            accepted = ranked[position < remaining[ranked_keys]]
+            assigned[active[accepted]] = zone[accepted]
+            remaining -= np.bincount(key[accepted], minlength=remaining.size)
+
+            choice[active] += 1
+            rejected = np.ones(len(active), dtype=bool)
+            rejected[accepted] = False
+            active = active[rejected]
+            exhausted = (choice[active] >= preferred.shape[1]) | ~np.isfinite(
+                preferred_scores[active, np.minimum(choice[active], preferred.shape[1] - 1)]
+            )
+            overflow.append(active[exhausted])
+            active = active[~exhausted]
+
+        # Every candidate is full: spread the rest over their candidates in proportion to demand
+        overflow = np.concatenate(overflow) if overflow else np.zeros(0, dtype=np.int64)
+        if len(overflow):
+            rows = preferred[overflow]
+            weights = np.where(
+                np.isfinite(preferred_scores[overflow]), self.demand[hours[overflow, None], np.maximum(rows, 0)], 0
+            )
+            totals = weights.sum(axis=1)
+            draw = np.random.default_rng(random_state).random(len(overflow)) * totals
+            pick = (np.cumsum(weights, axis=1) <= draw[:, None]).sum(axis=1)
+            pick = np.where(totals > 0, np.minimum(pick, rows.shape[1] - 1), 0)
+            assigned[overflow] = rows[np.arange(len(overflow)), pick]
+
+        # Assigned zone first, then the other candidates in score order (-1 padding is never the assigned zone)
+        is_assigned = (preferred == assigned[:, None]) & (preferred >= 0)
+        rest = np.argsort(is_assigned, axis=1, kind='stable')[:, :k - 1]
+        destinations = np.column_stack([assigned, np.take_along_axis(preferred, rest, axis=1)])
+        first_scores = np.take_along_axis(preferred_scores, is_assigned.argmax(axis=1)[:, None], axis=1)
+        first_scores[assigned < 0] = -np.inf
+        destination_scores = np.column_stack([first_scores, np.take_along_axis(preferred_scores, rest, axis=1)])
+        destinations[~np.isfinite(destination_scores)] = -1
+        return destinations, destination_scores
+
+
+def build_fleet_recommender(profit, travel, neighbors, demand):
+    """
+    Score every (hour, zone, candidate) once. `profit` is the zones x hours table of profit
+    per trip, `demand` the expected pickups per (hour, zone).
+    """
+    candidates = np.full((N_ZONES, N_CANDIDATES), -1, dtype=np.int16)
+    for zone in range(N_ZONES):
+        nearby = neighbors.nearby(zone, N_CANDIDATES - 1)[:N_CANDIDATES - 1]
+        candidates[zone, 0] = zone
+        candidates[zone, 1:1 + len(nearby)] = nearby
+
+    origins = np.arange(N_ZONES)[:, None]
+    padded = candidates < 0
+    safe = np.where(padded, origins, candidates)
+    scores = np.empty((N_HOURS, N_ZONES, N_CANDIDATES), dtype=np.float32)
+    for hour in range(N_HOURS):
+        next_hour = (hour + 1) % N_HOURS
+        _, _, per_minute = profit_per_minute(origins, safe, hour, profit[:, next_hour], travel, trip_hour=next_hour)
+        scores[hour] = np.where(padded | ~np.isfinite(per_minute), -np.inf, per_minute)
+    return FleetRecommender(candidates, scores, np.asarray(demand, dtype=np.float32))
+
+
+@st.cache_resource(max_entries=4)
+def _fleet_recommender(year, months):
+    tensor = load_profit_tensor(('hour',), where=year_filter(year, 'Date'))
+    return build_fleet_recommender(tensor.profit, load_travel_tensor(year), load_zone_neighbors(),
+                                   load_pickup_demand(year))
+
+
+def load_fleet_recommender(year):
+    """The fleet recommender of `year`, rebuilt when the months ingested change."""
+    od = load_od_matrix(year)
+    return _fleet_recommender(year, tuple(sorted(od.months.items())))
+
+
+def benchmark(recommender, n_drivers, repeat=5, k=3, random_state=0):
+    """Drivers answered per second by recommend() for `n_drivers` random zones and hours (best of `repeat`)."""
+    rng = np.random.default_rng(random_state)
+    zones = rng.integers(1, N_ZONES, n_drivers)
+    hours = rng.integers(0, N_HOURS, n_drivers)
+    best = np.inf
+    for _ in range(repeat):
+        started = time.perf_counter()
+        recommender.recommend(zones, hours, k=k)
+        best = min(best, time.perf_counter() - started)
+    return n_drivers / best
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Time batch fleet recommendations.")
+    parser.add_argument('--year', type=int, default=2025)
+    parser.add_argument('--drivers', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    recommender = load_fleet_recommender(args.year)
+    for n_drivers in args.drivers:
+        logger.info(f"{n_drivers} drivers: {benchmark(recommender, n_drivers, args.repeat):,.0f} drivers/s.")
@@ -0,0 +1,306 @@
+import os
+import json
+import time
+import logging
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+import config
+from data_access import query_batches
+from zones import N_ZONES
+from od_matrix import N_HOURS
+
+logger = logging.getLogger(__name__)
+
+# Sliding window over event time, kept as a ring of buckets
+WINDOW_MINUTES = 60
+BUCKET_SECONDS = 60
+# Exponentially decayed aggregates lose half their weight every HALF_LIFE_MINUTES
+HALF_LIFE_MINUTES = 30
+# Decayed sums are kept relative to a reference time, moved forward once the weights
+# of new events reach e^REBASE_AFTER
+REBASE_AFTER = 50.0
+# Live values replace the historical average of a zone and hour from this many trips
+# (decayed trips count by weight, so a few old events never do)
+MIN_LIVE_TRIPS = 5
+# How often the file sources look for new data
+POLL_SECONDS = 0.25
+
+# Trip events need these columns (a 'profit' column, when present, is used as is)
+EVENT_COLUMNS = ('tpep_pickup_datetime', 'PULocationID', 'fare_amount', 'tip_amount', 'trip_distance')
+EPOCH = pd.Timestamp(0, tz='UTC')
+
+
+def event_arrays(batch, fuel_cost_per_mile=config.FUEL_COST_PER_MILE):
+    """
+    (pickup epoch seconds, zone, profit) arrays of a batch of trip events: a pyarrow
+    Table or RecordBatch, a DataFrame, or one event as a dict. Events are filtered like
+    the cleaned layer and their profit computed the same way.
+    """
+    if isinstance(batch, dict):
+        batch = pd.DataFrame([batch])
+    if isinstance(batch, pd.DataFrame):
+        batch = pa.Table.from_pandas(batch, preserve_index=False)
+    columns = batch.schema.names
+    # Timestamps or ISO strings, to whole seconds; unparseable ones become NaN and are dropped
+    pickup = pd.to_datetime(batch.column('tpep_pickup_datetime').to_pandas(), errors='coerce', utc=True,
+                            format='ISO8601')
+    seconds = ((pickup - EPOCH) // pd.Timedelta(seconds=1)).to_numpy(dtype=np.float64, na_value=np.nan)
+    zone = batch.column('PULocationID').to_numpy(zero_copy_only=False).astype(np.float64)
+    distance = batch.column('trip_distance').to_numpy(zero_copy_only=False).astype(np.float64)
+    if 'profit' in columns:
+        profit = batch.column('profit').to_numpy(zero_copy_only=False).astype(np.float64)
+    else:
+        fare = batch.column('fare_amount').to_numpy(zero_copy_only=False).astype(np.float64)
+        tip = np.nan_to_num(batch.column('tip_amount').to_numpy(zero_copy_only=False).astype(np.float64))
+        profit = fare + tip - distance * fuel_cost_per_mile
+    keep = np.isfinite(seconds) & np.isfinite(zone) & np.isfinite(profit) & (zone >= 0) & (zone < N_ZONES)
+    keep &= ~(distance > 100)
+    if 'total_amount' in columns:
+        keep &= batch.column('total_amount').to_numpy(zero_copy_only=False).astype(np.float64) > 0
+    return seconds[keep].astype(np.int64), zone[keep].astype(np.int64), profit[keep]
+
+
+class LiveProfit:
+    """
+    Profit and trip counts per (PULocationID, pickup hour) over a stream of trip events.
+
+    Two views are kept up to date as events arrive:
+
+    - a sliding window over the last `window_minutes` of event time, as a ring of
+      buckets whose running totals drop a bucket when the window moves past it;
+    - exponentially decayed sums with a `half_life_minutes` half-life, kept as forward
+      decay: an event adds e^((t - t0) / tau) relative to a reference time t0, so adding
+      never touches older cells and reading only needs one scale factor.
+
+    Both cost O(1) per event (the ring clears a bucket once per BUCKET_SECONDS of event
+    time). Events older than the window are left out of it but still count, decayed.
+    While no events arrive, event time is taken to run on with the wall clock, so a
+    stalled feed empties the window and decays away instead of staying "live".
+    """
+
+    def __init__(self, window_minutes=WINDOW_MINUTES, bucket_seconds=BUCKET_SECONDS,
+                 half_life_minutes=HALF_LIFE_MINUTES):
+        self.bucket_seconds = bucket_seconds
+        self.n_buckets = max(1, window_minutes * 60 // bucket_seconds)
+        self.tau = half_life_minutes * 60 / np.log(2)
+        shape = (N_ZONES, N_HOURS)
+        self._bucket_ids = np.full(self.n_buckets, -1, dtype=np.int64)
+        self._bucket_profit = np.zeros((self.n_buckets, *shape))
+        self._bucket_trips = np.zeros((self.n_buckets, *shape), dtype=np.int64)
+        self._window_profit = np.zeros(shape)
+        self._window_trips = np.zeros(shape, dtype=np.int64)
+        self._decayed_profit = np.zeros(shape)
+        self._decayed_trips = np.zeros(shape)
+        self._reference = None
+        self.watermark = None
+        self.events = 0
+        # Wall-clock time of the last batch added
+        self._updated_at = None
+        self._lock = threading.Lock()
+
+    def _advance(self, bucket):
+        """Make the ring slot of `bucket` hold it; False when the bucket already left the window."""
+        slot = bucket % self.n_buckets
+        current = self._bucket_ids[slot]
+        if current == bucket:
+            return True
+        if current > bucket or bucket <= self._newest_bucket() - self.n_buckets:
+            return False
+        if current >= 0:
+            self._window_profit -= self._bucket_profit[slot]
+            self._window_trips -= self._bucket_trips[slot]
+            self._bucket_profit[slot] = 0
+            self._bucket_trips[slot] = 0
+        self._bucket_ids[slot] = bucket
+        return True
+
+    def _newest_bucket(self):
+        return -1 if self.watermark is None else self.watermark // self.bucket_seconds
+
+    def _rebase(self, seconds):
+        """Move the decay reference time up to `seconds` before the weights overflow."""
+        if self._reference is None:
+            self._reference = seconds
+        elif (seconds - self._reference) / self.tau > REBASE_AFTER:
+            scale = np.exp(-(seconds - self._reference) / self.tau)
+            self._decayed_profit *= scale
+            self._decayed_trips *= scale
+            self._reference = seconds
+
+    def add(self, seconds, zone, profit):
+        """Add one trip picked up at epoch `seconds` in `zone`."""
+        self.add_batch(np.array([seconds]), np.array([zone]), np.array([profit], dtype=np.float64))
+
+    def add_batch(self, seconds, zones, profits):
+        """Add a batch of trips given as equal-length arrays (see event_arrays)."""
+        if len(seconds) == 0:
+            return
+        seconds = np.asarray(seconds, dtype=np.int64)
+        profits = np.asarray(profits, dtype=np.float64)
+        hours = (seconds // 3600) % N_HOURS
+        cells = np.asarray(zones, dtype=np.int64) * N_HOURS + hours
+        buckets = seconds // self.bucket_seconds
+        with self._lock:
+            self._rebase(int(seconds.max()))
+            previous = self._newest_bucket()
+            newest = max(previous, int(buckets.max()))
+            self.watermark = max(self.watermark or 0, int(seconds.max()))
+            # Move the ring forward to the newest bucket, then take the events it still covers
+            for bucket in range(max(previous + 1, newest - self.n_buckets + 1), newest + 1):
+                self._advance(bucket)
+            in_window = buckets > newest - self.n_buckets
+            for bucket in np.unique(buckets[in_window]):
+                in_window &= (buckets != bucket) | self._advance(int(bucket))
+            flat = (buckets[in_window] % self.n_buckets) * N_ZONES * N_HOURS + cells[in_window]
+            np.add.at(self._bucket_profit.reshape(-1), flat, profits[in_window])
+            np.add.at(self._bucket_trips.reshape(-1), flat, 1)
+            np.add.at(self._window_profit.reshape(-1), cells[in_window], profits[in_window])
+            np.add.at(self._window_trips.reshape(-1), cells[in_window], 1)
+
+            weights = np.exp((seconds - self._reference) / self.tau)
+            np.add.at(self._decayed_profit.reshape(-1), cells, profits * weights)
+            np.add.at(self._decayed_trips.reshape(-1), cells, weights)
+            self.events += len(seconds)
+            self._updated_at = time.time()
+
+    def snapshot(self, now=None):
+        """
+        Current values as a dict of (zone, hour) arrays: average profit per trip and trip
+        counts over the window, decayed average profit and decayed trip counts (trips
+        weighted by age, scaled to the newest event), plus the watermark, event count and
+        `idle_seconds`, the wall-clock time since the last event arrived (as of `now`).
+        Idle time ages both views as if event time had moved on by as much.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            idle = 0.0 if self._updated_at is None else max(0.0, now - self._updated_at)
+            if idle < self.bucket_seconds:
+                window_profit, window_trips = self._window_profit.copy(), self._window_trips.copy()
+            else:
+                # Keep only the buckets still inside the window once the idle time is counted
+                newest = int(self.watermark + idle) // self.bucket_seconds
+                current = self._bucket_ids > newest - self.n_buckets
+                window_profit = self._bucket_profit[current].sum(axis=0)
+                window_trips = self._bucket_trips[current].sum(axis=0)
+            decayed_profit, decayed_trips = self._decayed_profit.copy(), self._decayed_trips.copy()
+            watermark, events, reference = self.watermark, self.events, self._reference
+        scale = 1.0 if watermark is None else np.exp(-(watermark + idle - reference) / self.tau)
+        return {
+            'window_profit': np.divide(window_profit, window_trips, out=np.zeros(window_profit.shape),
+                                       where=window_trips > 0),
+            'window_trips': window_trips,
+            'decayed_profit': np.divide(decayed_profit, decayed_trips, out=np.zeros(decayed_profit.shape),
+                                        where=decayed_trips > 0),
+            'decayed_trips': decayed_trips * scale,
+            'watermark': watermark,
+            'events': events,
+            'idle_seconds': idle,
+        }
+
+
+def parquet_drops(directory, poll_seconds=POLL_SECONDS, stop=None):
+    """
+    Yield the trips of every parquet file dropped in `directory`, oldest name first,
+    polling for new ones. Writers should drop files atomically (write, then rename).
+    """
+    seen = set()
+    while stop is None or not stop.is_set():
+        names = sorted(n for n in os.listdir(directory) if n.endswith('.parquet') and n not in seen)
+        for name in names:
+            seen.add(name)
+            try:
+                yield pq.read_table(os.path.join(directory, name))
+            except (OSError, pa.ArrowInvalid) as e:
+                logger.warning(f"Skipping live drop '{name}': {e}")
+        if not names:
+            time.sleep(poll_seconds)
+
+
+def tail_jsonl(path, poll_seconds=POLL_SECONDS, stop=None):
+    """Yield the trip events appended to the JSON-lines file at `path`, one DataFrame per read."""
+    with open(path) as f:
+        pending = ''
+        while stop is None or not stop.is_set():
+            chunk = f.read()
+            if not chunk:
+                time.sleep(poll_seconds)
+                continue
+            lines = (pending + chunk).split('\n')
+            pending = lines.pop()
+            events = []
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    logger.warning(f"Skipping malformed live event in '{path}': {e}")
+            if events:
+                yield pd.DataFrame(events)
+
+
+def replay_trips(where=None, batch_size=10_000):
+    """Yield the cleaned trips in pickup order as Arrow batches: an in-process source for testing."""
+    sql = f"SELECT {', '.join(EVENT_COLUMNS)}, total_amount, profit FROM trips"
+    if where:
+        sql += f"\nWHERE {where}"
+    sql += "\nORDER BY tpep_pickup_datetime"
+    yield from query_batches(sql, batch_size=batch_size)
+
+
+def open_source(path, stop=None):
+    """The event source at `path`: a directory of parquet drops or a JSON-lines file to tail."""
+    if os.path.isdir(path):
+        return parquet_drops(path, stop=stop)
+    return tail_jsonl(path, stop=stop)
+
+
+def consume(source, live, stop=None):
+    """Feed every batch of `source` (any iterable of event batches) into `live`; unreadable batches are skipped."""
+    for batch in source:
+        try:
+            arrays = event_arrays(batch)
+        except (KeyError, TypeError, ValueError, pa.ArrowException) as e:
+            logger.warning(f"Skipping live batch: {e!r}")
+            continue
+        live.add_batch(*arrays)
+        if stop is not None and stop.is_set():
+            break
+
+
+def start_consumer(source, live, stop=None, name='live-profit'):
+    """Consume `source` into `live` on a daemon thread; set the returned event to stop it."""
+    stop = stop or threading.Event()
+
+    def run():
+        try:
+            consume(source, live, stop)
+        except Exception:
+            logger.exception("Live profit consumer stopped.")
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+    return stop
+
+
+def load_live_profit(source_path=config.LIVE_EVENTS_PATH):
+    """
+    The live profit aggregates of the process, fed by a background consumer of
+    `source_path`, or None while there is no live source (checked again on every call,
+    so a source created later is still picked up).
+    """
+    if not source_path or not os.path.exists(source_path):
+        return None
+    return _live_profit(source_path)
+
+
+@st.cache_resource
+def _live_profit(source_path):
+    live = LiveProfit()
+    stop = threading.Event()
+    start_consumer(open_source(source_path, stop), live, stop)
+    logger.info(f"Consuming live trip events from '{source_path}'.")
+    return live
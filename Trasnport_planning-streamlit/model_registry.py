@@ -0,0 +1,159 @@
+import os
+import json
+import glob
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+import joblib
+import pandas as pd
+import streamlit as st
+import config
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_FILE = 'model.joblib'
+METADATA_FILE = 'metadata.json'
+
+# One lock per (registry root, model name): sessions wanting the same model train it once
+_TRAINING_LOCKS = {}
+_TRAINING_LOCKS_GUARD = threading.Lock()
+
+
+def data_fingerprint(data):
+    """Digest of a Series or DataFrame: its values, index and column names."""
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    names = data.columns if isinstance(data, pd.DataFrame) else [data.name]
+    digest.update(json.dumps([str(name) for name in names]).encode())
+    return digest.hexdigest()
+
+
+def params_key(params):
+    """Canonical text of a hyperparameter dict (tuples and lists compare equal)."""
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+class ModelRegistry:
+    """
+    Trained models stored under `root`/<name>/<version>/ with their metadata: the
+    fingerprint of the training data, the hyperparameters, metrics and training time.
+
+    Artifacts are written with joblib, uncompressed. Versions registered with
+    `mmap=True` are loaded with their NumPy arrays memory-mapped instead of read into
+    memory; that is opt-in per model, since it only helps array-heavy models and keeps
+    the files open while loaded. A version directory is only renamed into place once
+    complete.
+    """
+
+    def __init__(self, root=config.MODEL_REGISTRY_DIR):
+        self.root = root
+
+    def register(self, name, model, fingerprint, params, metrics=None, training_seconds=None, mmap=False):
+        """Store `model` as a new version of `name` and return its metadata."""
+        trained_at = datetime.now(timezone.utc)
+        version = f"{trained_at:%Y%m%dT%H%M%S%f}-{fingerprint[:12]}"
+        metadata = {
+            'name': name,
+            'version': version,
+            'fingerprint': fingerprint,
+            'params': json.loads(params_key(params)),
+            'metrics': {key: float(value) for key, value in (metrics or {}).items()},
+            'training_seconds': None if training_seconds is None else round(float(training_seconds), 3),
+            'trained_at': trained_at.isoformat(timespec='seconds'),
+            'mmap': bool(mmap),
+        }
+        final_dir = os.path.join(self.root, name, version)
+        tmp_dir = f"{final_dir}.tmp-{os.getpid()}"
+        os.makedirs(tmp_dir, exist_ok=True)
+        joblib.dump(model, os.path.join(tmp_dir, ARTIFACT_FILE))
+        with open(os.path.join(tmp_dir, METADATA_FILE), 'w') as f:
+            json.dump(metadata, f, indent=2, sort_keys=True)
+        os.rename(tmp_dir, final_dir)
+        logger.info(f"Registered {name} version {version}.")
+        return metadata
+
+    def versions(self, name):
+        """Metadata of every stored version of `name`, newest first."""
+        versions = []
+        for path in glob.glob(os.path.join(self.root, name, '*', METADATA_FILE)):
+            if '.tmp-' in path:
+                continue
+            with open(path) as f:
+                versions.append(json.load(f))
+        return sorted(versions, key=lambda metadata: metadata['version'], reverse=True)
+
+    def latest(self, name, fingerprint, params):
+        """Metadata of the newest version of `name` trained on the same data with `params`, or None."""
+        key = params_key(params)
+        for metadata in self.versions(name):
+            if metadata['fingerprint'] == fingerprint and params_key(metadata['params']) == key:
+                return metadata
+        return None
+
+    def artifact_path(self, metadata):
+        return os.path.join(self.root, metadata['name'], metadata['version'], ARTIFACT_FILE)
+
+    def prune(self, name, keep=3):
+        """
+        Remove all but the `keep` newest versions of `name`. A version whose artifact
+        cannot be removed yet (still memory-mapped, on Windows) is left whole for a later
+        prune.
+        """
+        for metadata in self.versions(name)[keep:]:
+            path = self.artifact_path(metadata)
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                logger.info(f"Keeping {name} version {metadata['version']} for now: {e}")
+                continue
+            shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+
+@st.cache_resource(max_entries=8)
+def _load_artifact(path, mmap=False):
+    # Versions never change once written, so the path is a complete cache key
+    return joblib.load(path, mmap_mode='r' if mmap else None)
+
+
+def _training_lock(root, name):
+    with _TRAINING_LOCKS_GUARD:
+        return _TRAINING_LOCKS.setdefault((os.path.abspath(root), name), threading.Lock())
+
+
+def load_model(name, fingerprint, params, registry=None):
+    """
+    The newest model `name` trained on data with `fingerprint` and `params`, with its
+    metadata, or (None, None) when there is none yet. Loaded once per process.
+    """
+    registry = registry or ModelRegistry()
+    metadata = registry.latest(name, fingerprint, params)
+    if metadata is None:
+        return None, None
+    return _load_artifact(registry.artifact_path(metadata), metadata.get('mmap', False)), metadata
+
+
+def train_and_register(name, train, fingerprint, params, evaluate=None, registry=None, mmap=False):
+    """
+    Train with `train()`, register the model and return (model, metadata). `evaluate`,
+    when given, maps the model to its metrics dict; `mmap` marks the version for
+    memory-mapped loading.
+
+    Sessions of the process train one model at a time per name: a session that waited
+    for the lock gets the version another one just registered instead of training again.
+    """
+    registry = registry or ModelRegistry()
+    with _training_lock(registry.root, name):
+        model, metadata = load_model(name, fingerprint, params, registry)
+        if metadata is not None:
+            return model, metadata
+        started = time.perf_counter()
+        model = train()
+        training_seconds = time.perf_counter() - started
+        metrics = evaluate(model) if evaluate else None
+        metadata = registry.register(name, model, fingerprint, params, metrics, training_seconds, mmap)
+        registry.prune(name)
+    return model, metadata
@@ -0,0 +1,255 @@
+import os
+import json
+import glob
+import hashlib
+import logging
+import threading
+import numpy as np
+import pandas as pd
+import streamlit as st
+import config
+from data_access import query_arrow
+from zones import N_ZONES
+
+logger = logging.getLogger(__name__)
+
+N_HOURS = 24
+# Slots 0-23 hold one pickup hour each, the last slot the whole day
+ALL_HOURS = N_HOURS
+N_SLOTS = N_HOURS + 1
+MEASURES = ('duration_seconds', 'trip_distance', 'fare_amount')
+
+# Trip count and medians per (hour, PU, DO) and per (PU, DO) of one month of cleaned trips
+PARTIAL_SQL = f"""
+SELECT COALESCE(Hour, {ALL_HOURS})::TINYINT AS slot,
+       PULocationID::SMALLINT AS pu_id,
+       DOLocationID::SMALLINT AS do_id,
+       COUNT(*)::INTEGER AS trips,
+       median(date_diff('second', tpep_pickup_datetime, tpep_dropoff_datetime))::DOUBLE AS duration_seconds,
+       median(trip_distance)::DOUBLE AS trip_distance,
+       median(fare_amount)::DOUBLE AS fare_amount
+FROM trips
+WHERE year = ? AND month = ?
+  AND PULocationID BETWEEN 1 AND {N_ZONES - 1} AND DOLocationID BETWEEN 1 AND {N_ZONES - 1}
+GROUP BY GROUPING SETS ((Hour, PULocationID, DOLocationID), (PULocationID, DOLocationID))
+"""
+
+
+def _empty_tensors():
+    shape = (N_SLOTS, N_ZONES, N_ZONES)
+    tensors = {'trips': np.zeros(shape, dtype=np.int32)}
+    tensors.update({name: np.zeros(shape) for name in MEASURES})
+    return tensors
+
+
+def _scatter(tensors, partial, sign):
+    """Add (sign=1) or remove (sign=-1) one month's partial from the dense tensors, in place."""
+    flat = (partial['slot'].astype(np.int64) * N_ZONES + partial['pu_id']) * N_ZONES + partial['do_id']
+    size = N_SLOTS * N_ZONES * N_ZONES
+    trips = partial['trips'].astype(np.float64)
+    tensors['trips'] += sign * np.bincount(flat, weights=trips, minlength=size).astype(np.int32).reshape(
+        tensors['trips'].shape
+    )
+    # Medians are stored weighted by their trip count so months can be added and removed exactly
+    for name in MEASURES:
+        weighted = trips * np.nan_to_num(partial[name])
+        tensors[name] += sign * np.bincount(flat, weights=weighted, minlength=size).reshape(tensors[name].shape)
+
+
+def _top(values, k):
+    """Indices of the `k` largest positive entries of a 1-d array, largest first."""
+    k = min(k, int(np.count_nonzero(values > 0)))
+    if k == 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(values, -k)[-k:]
+    return top[np.argsort(values[top])[::-1]]
+
+
+class ODMatrix:
+    """
+    Dense origin-destination statistics: arrays of shape (slot, PULocationID, DOLocationID).
+
+    Holds the trip count and the medians of trip duration (seconds), distance and fare of
+    every OD pair, per pickup hour (slots 0-23) and for the whole day (ALL_HOURS). Each
+    month is summarised once into a small partial file under `partial_dir`; sync() adds
+    new or re-ingested months and removes dropped ones without touching the others.
+
+    Medians across months are the trip-weighted mean of the monthly medians (exact when a
+    single month is loaded).
+    """
+
+    def __init__(self, partial_dir):
+        self.partial_dir = partial_dir
+        # Month tag -> month_checksum of every month included
+        self.months = {}
+        self._lock = threading.Lock()
+        self._tensors = self._with_totals(_empty_tensors())
+
+    @staticmethod
+    def _with_totals(tensors):
+        tensors['outflow'] = tensors['trips'].sum(axis=2, dtype=np.int64)
+        tensors['inflow'] = tensors['trips'].sum(axis=1, dtype=np.int64)
+        # Medians and pair rankings, derived lazily and dropped with the tensors they came from
+        tensors['derived'] = {}
+        return tensors
+
+    @staticmethod
+    def _derived(tensors, key, compute):
+        derived = tensors['derived']
+        if key not in derived:
+            derived[key] = compute()
+        return derived[key]
+
+    def _partial_path(self, month_tag, checksum):
+        return os.path.join(self.partial_dir, f"{month_tag}-{checksum[:16]}.npz")
+
+    def _read_partial(self, month_tag, checksum):
+        path = self._partial_path(month_tag, checksum)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as partial:
+            return {name: partial[name] for name in partial.files}
+
+    def _build_partial(self, month_tag, checksum):
+        """Summarise one month of cleaned trips and persist it, replacing older versions."""
+        year, month = (int(part) for part in month_tag.split('-'))
+        table = query_arrow(PARTIAL_SQL, [year, month])
+        partial = {name: table.column(name).to_numpy() for name in table.column_names}
+
+        os.makedirs(self.partial_dir, exist_ok=True)
+        path = self._partial_path(month_tag, checksum)
+        for old in glob.glob(os.path.join(self.partial_dir, f"{month_tag}-*.npz")):
+            os.remove(old)
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, **partial)
+        os.replace(path + '.tmp', path)
+        logger.info(f"OD partial of {month_tag} built from {table.num_rows} OD rows.")
+        return partial
+
+    def sync(self, months):
+        """
+        Bring the tensors in line with the manifest's `months` and return whether anything changed.
+
+        Only months whose month_checksum differs from the one loaded are touched. The new
+        tensors are swapped in whole, so readers never see a half-applied update.
+        """
+        wanted = {tag: month_checksum(entry) for tag, entry in months.items()}
+        with self._lock:
+            if wanted == self.months:
+                return False
+            tensors = {name: self._tensors[name].copy() for name in ('trips', *MEASURES)}
+            included = dict(self.months)
+            for tag, checksum in self.months.items():
+                if wanted.get(tag) == checksum:
+                    continue
+                partial = self._read_partial(tag, checksum)
+                if partial is None:
+                    # Superseded by another process already: start over from the partials
+                    tensors, included = _empty_tensors(), {}
+                    break
+                _scatter(tensors, partial, -1)
+                del included[tag]
+            for tag, checksum in sorted(wanted.items()):
+                if included.get(tag) == checksum:
+                    continue
+                partial = self._read_partial(tag, checksum) or self._build_partial(tag, checksum)
+                _scatter(tensors, partial, 1)
+                included[tag] = checksum
+            self._tensors, self.months = self._with_totals(tensors), included
+            return True
+
+    @staticmethod
+    def _slot(hour):
+        return ALL_HOURS if hour is None else int(hour)
+
+    def trips(self, hour=None):
+        """Trip counts, origins x destinations, for one pickup hour or the whole day."""
+        return self._tensors['trips'][self._slot(hour)]
+
+    def median(self, measure, hour=None):
+        """Median `measure` per OD pair (NaN where there are no trips)."""
+        slot = self._slot(hour)
+        tensors = self._tensors
+
+        def compute():
+            trips = tensors['trips'][slot]
+            out = np.full(trips.shape, np.nan)
+            return np.divide(tensors[measure][slot], trips, out=out, where=trips > 0)
+        return self._derived(tensors, (measure, slot), compute)
+
+    def outflow(self, hour=None):
+        """Trips leaving each zone, indexed by LocationID."""
+        return self._tensors['outflow'][self._slot(hour)]
+
+    def inflow(self, hour=None):
+        """Trips arriving in each zone, indexed by LocationID."""
+        return self._tensors['inflow'][self._slot(hour)]
+
+    def top_origins(self, k=10, hour=None):
+        """(LocationIDs, trips) of the `k` busiest pickup zones."""
+        outflow = self.outflow(hour)
+        top = _top(outflow, k)
+        return top, outflow[top]
+
+    def top_destinations(self, k=10, hour=None, origin=None):
+        """(LocationIDs, trips) of the `k` busiest drop-off zones, overall or from `origin`."""
+        trips = self.inflow(hour) if origin is None else self.trips(hour)[origin]
+        top = _top(trips, k)
+        return top, trips[top]
+
+    def top_pairs(self, k=10, hour=None):
+        """(origins, destinations, trips) of the `k` busiest OD pairs."""
+        slot = self._slot(hour)
+        tensors = self._tensors
+        trips = tensors['trips'][slot].ravel()
+
+        def compute():
+            # Every travelled pair, busiest first: later queries just slice it
+            ranked = _top(trips, trips.size)
+            return ranked, trips[ranked]
+        ranked, ranked_trips = self._derived(tensors, ('pairs', slot), compute)
+        origins, destinations = np.divmod(ranked[:k], N_ZONES)
+        return origins, destinations, ranked_trips[:k]
+
+    def borough_trips(self, zones, hour=None):
+        """Trips rolled up to pickup borough x drop-off borough, using the zone dimension."""
+        membership = np.zeros((N_ZONES, len(zones.boroughs)))
+        membership[np.arange(N_ZONES), zones.borough_code] = 1
+        rollup = membership.T @ self.trips(hour) @ membership
+        return pd.DataFrame(rollup.astype(np.int64), index=zones.boroughs, columns=zones.boroughs)
+
+
+def read_months(output_dir=config.SAMPLED_DATA_DIR):
+    """The `months` section of the ingestion manifest, empty before the first run."""
+    manifest_path = os.path.join(output_dir, config.MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f).get('months', {})
+
+
+def month_checksum(entry):
+    """
+    Checksum of what a month's datasets were built from, per its manifest `entry`: the
+    source file and the sampler's fraction and seed. Caches of derived data key on it.
+    """
+    key = json.dumps([entry['source_sha256'], entry.get('sample_fraction'), entry.get('random_state')])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+@st.cache_resource
+def _shared_od_matrix(year=None):
+    return ODMatrix(os.path.join(config.SAMPLED_DATA_DIR, config.OD_MATRIX_DIR))
+
+
+def load_od_matrix(year=None):
+    """
+    The process-wide OD matrix of `year` (or of every month), first brought up to date
+    with the months ingested so far.
+    """
+    months = read_months()
+    if year is not None:
+        months = {tag: entry for tag, entry in months.items() if tag.startswith(f"{int(year)}-")}
+    matrix = _shared_od_matrix(year)
+    matrix.sync(months)
+    return matrix
@@ -0,0 +1,148 @@
+import os
+import json
+import glob
+import time
+import shutil
+import hashlib
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import numpy as np
+import streamlit as st
+import config
+from data_access import year_filter
+from od_matrix import month_checksum, read_months
+from recommendation import build_profit_tensor
+
+logger = logging.getLogger(__name__)
+
+# Day slots of the table: every day first, then Monday = 1 ... Sunday = 7
+ALL_DAYS = 0
+ARRAYS = ('profit', 'trips')
+# Published versions kept per year: the current one and the one before it, which
+# sessions may still have mapped
+KEEP_VERSIONS = 2
+# Private directories of a publish that never finished are removed after this long
+STALE_TMP_SECONDS = 3600
+
+
+@dataclass(frozen=True)
+class ProfitTable:
+    """
+    One published version of the route recommendation table, mapped read-only.
+
+    `profit` (average profit per trip, 0 without trips) and `trips` have shape (zone,
+    day slot, hour) and are memory maps over the version's files, so every session and
+    every worker process reads the same pages without a copy. `metadata` records the
+    year, the months (and their month_checksum) it was built from and its totals.
+    """
+    version: str
+    profit: np.ndarray
+    trips: np.ndarray
+    metadata: dict
+
+    def day(self, day=None):
+        """(profit, trips) tables of zone x hour for day of week `day` (Monday = 0), or every day. Views, not copies."""
+        slot = ALL_DAYS if day is None else 1 + int(day)
+        return self.profit[:, slot, :], self.trips[:, slot, :]
+
+
+def table_version(year, checksums):
+    """Version of the table built from the months in `checksums` (tag -> month_checksum)."""
+    key = json.dumps([int(year), sorted(checksums.items())])
+    return f"{int(year)}-{hashlib.sha256(key.encode()).hexdigest()[:16]}"
+
+
+def build_table(year):
+    """(profit, trips) arrays of zone x day slot x hour for `year`, from the trip cube."""
+    tensor = build_profit_tensor(('day_of_week', 'hour'), where=year_filter(year, 'Date'))
+    profit_sum = np.concatenate([tensor.profit_sum.sum(axis=1, keepdims=True), tensor.profit_sum], axis=1)
+    trips = np.concatenate([tensor.trips.sum(axis=1, keepdims=True), tensor.trips], axis=1)
+    profit = np.divide(profit_sum, trips, out=np.zeros(profit_sum.shape), where=trips > 0)
+    return profit, trips
+
+
+def publish_table(root, version, arrays, metadata):
+    """
+    Write a table version under `root` and make it visible in one step.
+
+    The files go to a private directory first, which is then renamed to the version
+    name, so readers see either no version or a complete one. The KEEP_VERSIONS newest
+    versions of the year stay on disk, so the one sessions switched away from is only
+    removed by the publish after next (files still mapped elsewhere are left for a later
+    publish to retry), along with private directories left by crashed publishes.
+    """
+    final_dir = os.path.join(root, version)
+    tmp_dir = f"{final_dir}.tmp-{os.getpid()}"
+    os.makedirs(tmp_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+    with open(os.path.join(tmp_dir, 'metadata.json'), 'w') as f:
+        json.dump(metadata, f, indent=2, sort_keys=True)
+    try:
+        os.rename(tmp_dir, final_dir)
+    except OSError:
+        # Another process published the same version first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return final_dir
+    logger.info(f"Published profit table {version}.")
+    prune_versions(root, version.split('-')[0])
+    return final_dir
+
+
+def prune_versions(root, year, keep=KEEP_VERSIONS):
+    """Remove all but the `keep` newest published versions of `year`, and stale private directories."""
+    now = time.time()
+    published = {}
+    for path in glob.glob(os.path.join(root, f"{year}-*")):
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            continue  # Removed by another process meanwhile
+        if '.tmp-' not in path:
+            published[path] = mtime
+        elif now - mtime > STALE_TMP_SECONDS:
+            shutil.rmtree(path, ignore_errors=True)
+    for old in sorted(published, key=published.get, reverse=True)[keep:]:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def map_table(version_dir):
+    """The ProfitTable stored in `version_dir`, its arrays memory-mapped read-only."""
+    arrays = {name: np.load(os.path.join(version_dir, f"{name}.npy"), mmap_mode='r') for name in ARRAYS}
+    with open(os.path.join(version_dir, 'metadata.json')) as f:
+        metadata = json.load(f)
+    return ProfitTable(os.path.basename(version_dir), arrays['profit'], arrays['trips'], metadata)
+
+
+@st.cache_resource(max_entries=4)
+def _profit_table(year, version, checksums):
+    root = os.path.join(config.SAMPLED_DATA_DIR, config.PROFIT_TABLE_DIR)
+    version_dir = os.path.join(root, version)
+    if not os.path.exists(version_dir):
+        profit, trips = build_table(year)
+        metadata = {
+            'year': int(year),
+            'months': dict(checksums),
+            'dims': ['zone', 'day_slot', 'hour'],
+            'trips': int(trips[:, ALL_DAYS].sum()),
+            'profit': float((profit[:, ALL_DAYS] * trips[:, ALL_DAYS]).sum()),
+            'built_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        }
+        arrays = {'profit': profit.astype(np.float32), 'trips': trips.astype(np.int32)}
+        publish_table(root, version, arrays, metadata)
+    return map_table(version_dir)
+
+
+def load_profit_table(year):
+    """
+    The current profit table of `year`, shared by every session of the process.
+
+    The version follows the months ingested: when the manifest changes, the next rerun
+    maps (or first publishes) the new version while sessions still holding the old one
+    keep reading it.
+    """
+    checksums = {
+        tag: month_checksum(entry) for tag, entry in read_months().items() if tag.startswith(f"{int(year)}-")
+    }
+    return _profit_table(int(year), table_version(year, checksums), tuple(sorted(checksums.items())))
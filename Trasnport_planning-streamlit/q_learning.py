@@ -0,0 +1,232 @@
+import os
+import time
+import argparse
+import logging
+import numpy as np
+import streamlit as st
+import config
+from data_access import query_arrow
+from zones import N_ZONES
+from od_matrix import N_HOURS
+from zone_geometry import load_zone_neighbors
+from recommendation import MILES_PER_KM, DEFAULT_CIRCUITY
+
+try:
+    import numba
+except ImportError:  # optional: only the sequential trainer needs it
+    numba = None
+
+logger = logging.getLogger(__name__)
+
+# Actions of the route_optimization notebook: stay, or move to the bordering zone in a direction
+ACTIONS = ('Stay', 'North', 'South', 'East', 'West')
+_DIRECTIONS = np.array([[0, 0], [0, 1], [0, -1], [1, 0], [-1, 0]], dtype=np.float64)
+N_ACTIONS = len(ACTIONS)
+
+ALPHA = 0.1    # Learning rate
+GAMMA = 0.9    # Discount factor (future rewards matter)
+BATCH_SIZE = 64 * 1024
+
+TRANSITIONS_SQL = f"""
+SELECT PULocationID::SMALLINT AS pu_id,
+       Hour::TINYINT AS hour,
+       DOLocationID::SMALLINT AS do_id,
+       hour(tpep_dropoff_datetime)::TINYINT AS dropoff_hour,
+       profit::FLOAT AS profit
+FROM trips
+WHERE PULocationID BETWEEN 1 AND {N_ZONES - 1} AND DOLocationID BETWEEN 1 AND {N_ZONES - 1}
+  AND profit IS NOT NULL
+"""
+
+
+def move_table(neighbors):
+    """
+    Zone reached by each action, shape (N_ZONES, N_ACTIONS): the bordering zone whose
+    centroid lies most in that direction, or the zone itself when there is none.
+    """
+    moves = np.repeat(np.arange(N_ZONES)[:, None], N_ACTIONS, axis=1)
+    centroids = neighbors.centroid_km.astype(np.float64)
+    for zone in range(N_ZONES):
+        adjacent = neighbors.adjacent(zone).astype(np.int64)
+        if len(adjacent) == 0 or np.isnan(centroids[zone]).any():
+            continue
+        offsets = centroids[adjacent] - centroids[zone]
+        lengths = np.hypot(offsets[:, 0], offsets[:, 1])
+        alignment = (offsets @ _DIRECTIONS[1:].T) / np.where(lengths > 0, lengths, np.inf)[:, None]
+        alignment = np.nan_to_num(alignment, nan=-1.0)
+        best = alignment.argmax(axis=0)
+        pointing = alignment[best, np.arange(N_ACTIONS - 1)] > 0
+        moves[zone, 1:] = np.where(pointing, adjacent[best], zone)
+    return moves
+
+
+def build_transitions(trips, moves, neighbors, fuel_cost_per_mile=config.FUEL_COST_PER_MILE):
+    """
+    Turn trips into offline (zone, hour, action, reward, next zone, next hour) transitions.
+
+    A trip picked up in zone P is the outcome of every (zone, action) whose move lands in
+    P: staying in P, or moving into P from a bordering zone. The reward is the trip's
+    profit less the fuel of that move; the next state is the drop-off zone and hour.
+    Returns a dict of equal-length arrays.
+    """
+    zone, action = np.nonzero(np.ones_like(moves, dtype=bool))
+    landing = moves[zone, action]
+    # Drop moves that don't go anywhere (they duplicate 'Stay')
+    keep = (action == 0) | (landing != zone)
+    zone, action, landing = zone[keep], action[keep], landing[keep]
+
+    centroids = neighbors.centroid_km.astype(np.float64)
+    move_miles = np.nan_to_num(
+        np.hypot(*(centroids[landing] - centroids[zone]).T) * MILES_PER_KM * DEFAULT_CIRCUITY
+    )
+
+    # Group the (zone, action) pairs by landing zone, then pair every trip with its group
+    order = np.argsort(landing, kind='stable')
+    zone, action, landing, move_miles = zone[order], action[order], landing[order], move_miles[order]
+    starts = np.searchsorted(landing, np.arange(N_ZONES + 1))
+    pu = trips['pu_id'].astype(np.int64)
+    per_trip = starts[pu + 1] - starts[pu]
+    trip_index = np.repeat(np.arange(len(pu)), per_trip)
+    pair_index = np.repeat(starts[pu], per_trip) + (
+        np.arange(len(trip_index)) - np.repeat(np.cumsum(per_trip) - per_trip, per_trip)
+    )
+    return {
+        'zone': zone[pair_index].astype(np.int16),
+        'hour': trips['hour'][trip_index].astype(np.int8),
+        'action': action[pair_index].astype(np.int8),
+        'reward': (trips['profit'][trip_index] - move_miles[pair_index] * fuel_cost_per_mile).astype(np.float32),
+        'next_zone': trips['do_id'][trip_index].astype(np.int16),
+        'next_hour': trips['dropoff_hour'][trip_index].astype(np.int8),
+    }
+
+
+def load_transitions(where=None):
+    """Transitions built from the cleaned trips (optionally filtered by the SQL predicate `where`)."""
+    sql = TRANSITIONS_SQL + (f"  AND {where}\n" if where else "")
+    table = query_arrow(sql)
+    trips = {name: table.column(name).to_numpy() for name in table.column_names}
+    return build_transitions(trips, load_moves(), load_zone_neighbors())
+
+
+def _batch_update(q, state, action, reward, next_state, alpha, gamma):
+    """
+    One vectorized Q-learning step over a batch, in place on the flat (state, action) table.
+
+    TD targets use the Q-table as it was before the batch. A (state, action) cell seen
+    n times moves by its mean TD error with rate 1 - (1 - alpha)^n, which is what n
+    sequential updates towards that same target would do.
+    """
+    n_actions = q.shape[1]
+    target = reward + gamma * q[next_state].max(axis=1)
+    cell = state * n_actions + action
+    td_error = target - q.ravel()[cell]
+    counts = np.bincount(cell, minlength=q.size)
+    seen = np.flatnonzero(counts)
+    mean_error = np.bincount(cell, weights=td_error, minlength=q.size)[seen] / counts[seen]
+    q.ravel()[seen] += (1 - (1 - alpha) ** counts[seen]) * mean_error
+
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _sequential_epoch(q, state, action, reward, next_state, alpha, gamma):
+        """Classic one-transition-at-a-time Q-learning, compiled."""
+        for i in range(len(state)):
+            best = q[next_state[i]].max()
+            q[state[i], action[i]] += alpha * (reward[i] + gamma * best - q[state[i], action[i]])
+
+
+def save_checkpoint(q_table, path, **metadata):
+    """Write the Q-table (zone x hour x action) and its training metadata atomically."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        np.savez(f, q_table=q_table, actions=np.array(ACTIONS), **metadata)
+    os.replace(path + '.tmp', path)
+
+
+def load_checkpoint(path):
+    """(Q-table, metadata dict) of a checkpoint."""
+    with np.load(path) as checkpoint:
+        metadata = {name: checkpoint[name] for name in checkpoint.files if name not in ('q_table', 'actions')}
+        return checkpoint['q_table'], metadata
+
+
+def train(transitions, epochs=5, alpha=ALPHA, gamma=GAMMA, batch_size=BATCH_SIZE, method='batch',
+          random_state=42, q_table=None, checkpoint_path=None, epochs_done=0):
+    """
+    Train a (zone, hour, action) Q-table on offline transitions for `epochs` shuffled passes.
+
+    method='batch' runs vectorized NumPy updates of `batch_size` transitions;
+    method='sequential' runs the classic per-transition update compiled with numba.
+    Starts from `q_table` when given, trained for `epochs_done` epochs already, and
+    writes a checkpoint after every epoch with the running total.
+    """
+    if method == 'sequential' and numba is None:
+        raise ImportError("method='sequential' needs numba; use method='batch' or install numba")
+    q = np.zeros((N_ZONES * N_HOURS, N_ACTIONS)) if q_table is None else q_table.reshape(-1, N_ACTIONS).copy()
+    state = transitions['zone'].astype(np.int64) * N_HOURS + transitions['hour']
+    next_state = transitions['next_zone'].astype(np.int64) * N_HOURS + transitions['next_hour']
+    action = transitions['action'].astype(np.int64)
+    reward = transitions['reward'].astype(np.float64)
+    rng = np.random.default_rng(random_state)
+
+    for epoch in range(1, epochs + 1):
+        started = time.perf_counter()
+        order = rng.permutation(len(state))
+        if method == 'sequential':
+            _sequential_epoch(q, state[order], action[order], reward[order], next_state[order], alpha, gamma)
+        else:
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                _batch_update(q, state[batch], action[batch], reward[batch], next_state[batch], alpha, gamma)
+        logger.info(f"Epoch {epochs_done + epoch}/{epochs_done + epochs}: {len(state)} transitions "
+                    f"in {time.perf_counter() - started:.2f}s.")
+        if checkpoint_path:
+            save_checkpoint(q.reshape(N_ZONES, N_HOURS, N_ACTIONS), checkpoint_path,
+                            epochs=epochs_done + epoch, alpha=alpha, gamma=gamma, transitions=len(state))
+    return q.reshape(N_ZONES, N_HOURS, N_ACTIONS)
+
+
+@st.cache_resource
+def load_moves():
+    """The move table of the current zone map, built once per process."""
+    return move_table(load_zone_neighbors())
+
+
+def load_q_table(path=config.Q_TABLE_PATH):
+    """
+    The trained Q-table for the pages, or None until the trainer has written one.
+    Reloaded when the trainer writes a new checkpoint.
+    """
+    if not os.path.exists(path):
+        return None
+    return _q_table(path, os.path.getmtime(path))
+
+
+@st.cache_resource(max_entries=2)
+def _q_table(path, mtime):
+    # `mtime` only keys the cache on the checkpoint written last
+    return load_checkpoint(path)[0]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Train the zone x hour x action Q-table on the cleaned trips.")
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--alpha', type=float, default=ALPHA)
+    parser.add_argument('--gamma', type=float, default=GAMMA)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--method', choices=('batch', 'sequential'), default='batch',
+                        help="Vectorized batches, or per-transition updates compiled with numba")
+    parser.add_argument('--checkpoint', default=config.Q_TABLE_PATH)
+    parser.add_argument('--resume', action='store_true', help="Continue from the existing checkpoint")
+    args = parser.parse_args()
+
+    transitions = load_transitions()
+    logger.info(f"Built {len(transitions['zone'])} transitions.")
+    start, epochs_done = None, 0
+    if args.resume and os.path.exists(args.checkpoint):
+        start, metadata = load_checkpoint(args.checkpoint)
+        epochs_done = int(metadata.get('epochs', 0))
+        logger.info(f"Resuming from epoch {epochs_done}.")
+    train(transitions, args.epochs, args.alpha, args.gamma, args.batch_size, args.method,
+          q_table=start, checkpoint_path=args.checkpoint, epochs_done=epochs_done)
@@ -0,0 +1,298 @@
+from dataclasses import dataclass
+import duckdb
+import numpy as np
+import streamlit as st
+import config
+from data_access import query, year_filter
+from zones import N_ZONES
+from od_matrix import N_HOURS, load_od_matrix, month_checksum, read_months
+from zone_geometry import load_zone_neighbors
+
+# Dimensions a profit tensor can be split by, after the pickup zone:
+# name -> (size, expression over trip_cube or None if the cube is too coarse, expression over trips)
+DIMENSIONS = {
+    'day_of_week': (7, 'isodow(Date) - 1', 'DayOfWeek'),  # Monday = 0
+    'hour': (24, 'Hour', 'Hour'),
+    'quarter_hour': (96, None, 'Hour * 4 + minute(tpep_pickup_datetime) // 15'),
+}
+
+# OD medians are trusted from this many trips up; sparser pairs use a fallback estimate
+MIN_TRAVEL_TRIPS = 3
+MILES_PER_KM = 0.621371
+# Road miles per straight-line mile when it can't be estimated from the data
+DEFAULT_CIRCUITY = 1.3
+# Distance of an empty hop inside a zone with no intra-zone trips on record
+MIN_INTRA_ZONE_MILES = 0.5
+
+
+@dataclass(frozen=True)
+class ProfitTensor:
+    """
+    Profit totals and trip counts per pickup zone and `dims`, as arrays of shape
+    (N_ZONES, *sizes of dims) indexed by LocationID and the dimension values.
+    """
+    dims: tuple
+    profit_sum: np.ndarray
+    trips: np.ndarray
+
+    @property
+    def profit(self):
+        """Average profit per trip, 0 where there is no trip to average."""
+        out = np.zeros(self.profit_sum.shape)
+        return np.divide(self.profit_sum, self.trips, out=out, where=self.trips > 0)
+
+    def _axis(self, dim):
+        return 1 + self.dims.index(dim)
+
+    def collapse(self, dim):
+        """Sum `dim` away, e.g. day_of_week x hour -> hour over every day."""
+        axis = self._axis(dim)
+        return ProfitTensor(
+            tuple(d for d in self.dims if d != dim),
+            self.profit_sum.sum(axis=axis),
+            self.trips.sum(axis=axis),
+        )
+
+    def select(self, dim, value):
+        """Slice one value of `dim`, e.g. day_of_week=5 -> Saturdays only."""
+        axis = self._axis(dim)
+        return ProfitTensor(
+            tuple(d for d in self.dims if d != dim),
+            np.take(self.profit_sum, value, axis=axis),
+            np.take(self.trips, value, axis=axis),
+        )
+
+
+def scatter_tensor(dims, zone_ids, keys, trips, profit_sum):
+    """
+    Scatter grouped rows into a ProfitTensor in one pass.
+
+    `zone_ids` and each array of `keys` (one per dim) give the cell of every row; rows
+    outside the tensor are dropped. Repeated cells are summed.
+    """
+    sizes = (N_ZONES, *(DIMENSIONS[dim][0] for dim in dims))
+    index = [np.asarray(zone_ids, dtype=np.int64), *(np.asarray(k, dtype=np.int64) for k in keys)]
+    valid = np.logical_and.reduce([(i >= 0) & (i < size) for i, size in zip(index, sizes)])
+    flat = np.ravel_multi_index([i[valid] for i in index], sizes)
+    n_cells = int(np.prod(sizes))
+    return ProfitTensor(
+        tuple(dims),
+        np.bincount(flat, weights=np.asarray(profit_sum, dtype=np.float64)[valid], minlength=n_cells).reshape(sizes),
+        np.bincount(flat, weights=np.asarray(trips, dtype=np.float64)[valid], minlength=n_cells)
+        .astype(np.int64).reshape(sizes),
+    )
+
+
+def build_profit_tensor(dims=('hour',), where=None):
+    """
+    Profit tensor of pickup zone x `dims`, grouped by DuckDB and scattered with NumPy.
+
+    Reads the trip cube when every dim can be derived from it and the cleaned trips
+    otherwise (quarter hours). `where` is a predicate valid on both, e.g.
+    year_filter(2025, 'Date').
+    """
+    from_cube = all(DIMENSIONS[dim][1] is not None for dim in dims)
+    select = ['PULocationID'] + [f"{DIMENSIONS[dim][1 if from_cube else 2]} AS {dim}" for dim in dims]
+    if from_cube:
+        select += ['SUM(trip_count) AS trip_count', 'SUM(profit) AS profit']
+    else:
+        select += ['COUNT(*) AS trip_count', 'SUM(profit) AS profit']
+    sql = f"SELECT {', '.join(select)}\nFROM {'trip_cube' if from_cube else 'trips'}"
+    if where:
+        sql += f"\nWHERE {where}"
+    sql += "\nGROUP BY ALL"
+    grouped = query(sql, dtype_backend='numpy')
+    return scatter_tensor(
+        dims,
+        grouped['PULocationID'].to_numpy(),
+        [grouped[dim].to_numpy() for dim in dims],
+        grouped['trip_count'].to_numpy(),
+        grouped['profit'].to_numpy(),
+    )
+
+
+@st.cache_data
+def load_profit_tensor(dims=('hour',), where=None):
+    """build_profit_tensor(), cached per (dims, where)."""
+    return build_profit_tensor(dims, where)
+
+
+@dataclass(frozen=True)
+class TravelTensor:
+    """
+    Typical driving time and distance between zones, as arrays of shape (hour, origin,
+    destination) indexed by pickup hour and LocationID, like the OD matrix.
+
+    `observed` marks the cells taken straight from that hour's OD medians; the others are
+    fallback estimates (NaN only for zones without trips or geometry). `trip_minutes` is
+    the average length of a paid trip starting in each zone, shape (hour, zone).
+    """
+    minutes: np.ndarray
+    miles: np.ndarray
+    observed: np.ndarray
+    trip_minutes: np.ndarray
+
+
+def build_travel_tensor(od, neighbors, min_trips=MIN_TRAVEL_TRIPS):
+    """
+    Fill the travel tensor from the OD medians, falling back for each hour and pair, in order, on:
+
+    1. the pair's whole-day medians, with the time rescaled to that hour's city-wide speed;
+    2. the medians of the reverse direction in that hour;
+    3. the straight-line distance between centroids times the observed circuity, driven
+       at that hour's city-wide speed.
+    """
+    trips = np.stack([od.trips(hour) for hour in range(N_HOURS)])
+    minutes = np.stack([od.median('duration_seconds', hour) for hour in range(N_HOURS)]) / 60
+    miles = np.stack([od.median('trip_distance', hour) for hour in range(N_HOURS)])
+    observed = (trips >= min_trips) & (minutes > 0)
+
+    # City-wide miles per minute, per hour and over the whole day
+    weighted_miles = np.where(observed, trips * miles, 0).sum(axis=(1, 2))
+    weighted_minutes = np.where(observed, trips * minutes, 0).sum(axis=(1, 2))
+    day_speed = weighted_miles.sum() / weighted_minutes.sum() if weighted_minutes.sum() > 0 else np.nan
+    speed = np.divide(
+        weighted_miles, weighted_minutes, out=np.full(N_HOURS, day_speed), where=weighted_minutes > 0
+    )
+
+    travel_minutes = np.where(observed, minutes, np.nan)
+    travel_miles = np.where(observed, miles, np.nan)
+
+    # 1. Whole-day medians of the pair
+    day_trips = od.trips()
+    day_minutes = od.median('duration_seconds') / 60
+    day_miles = od.median('trip_distance')
+    day_observed = (day_trips >= min_trips) & (day_minutes > 0)
+    fill = np.isnan(travel_minutes) & day_observed
+    rescaled = day_minutes * (day_speed / speed)[:, None, None]
+    travel_minutes[fill] = rescaled[fill]
+    travel_miles[fill] = np.broadcast_to(day_miles, fill.shape)[fill]
+
+    # 2. Reverse direction
+    reverse_minutes = travel_minutes.transpose(0, 2, 1).copy()
+    reverse_miles = travel_miles.transpose(0, 2, 1).copy()
+    fill = np.isnan(travel_minutes) & ~np.isnan(reverse_minutes)
+    travel_minutes[fill] = reverse_minutes[fill]
+    travel_miles[fill] = reverse_miles[fill]
+
+    # 3. Centroid distance on the road network
+    centroids = neighbors.centroid_km.astype(np.float64)
+    straight = np.hypot(*(centroids[:, None, :] - centroids[None, :, :]).transpose(2, 0, 1)) * MILES_PER_KM
+    between = day_observed & (straight > 0)
+    circuity = np.median(day_miles[between] / straight[between]) if between.any() else DEFAULT_CIRCUITY
+    circuity = float(np.clip(circuity, 1.0, 3.0))
+    estimate_miles = straight * circuity
+    diagonal = np.diag(np.where(day_observed, day_miles, np.nan))
+    intra_zone = np.nanmedian(diagonal) if np.isfinite(diagonal).any() else MIN_INTRA_ZONE_MILES
+    np.fill_diagonal(estimate_miles, max(intra_zone, MIN_INTRA_ZONE_MILES))
+    fill = np.isnan(travel_minutes) & ~np.isnan(estimate_miles)
+    travel_miles[fill] = np.broadcast_to(estimate_miles, fill.shape)[fill]
+    travel_minutes[fill] = (estimate_miles[None, :, :] / speed[:, None, None])[fill]
+
+    # Average paid trip length per pickup zone, city-wide average where a zone has no trips
+    outflow = trips.sum(axis=2)
+    occupied = np.where(trips > 0, trips * np.nan_to_num(minutes), 0).sum(axis=2)
+    city_trip = np.divide(occupied.sum(axis=1), outflow.sum(axis=1), out=np.full(N_HOURS, np.nan),
+                          where=outflow.sum(axis=1) > 0)
+    trip_minutes = np.divide(occupied, outflow, out=np.repeat(city_trip[:, None], N_ZONES, axis=1),
+                             where=outflow > 0)
+
+    return TravelTensor(
+        minutes=travel_minutes.astype(np.float32),
+        miles=travel_miles.astype(np.float32),
+        observed=observed,
+        trip_minutes=trip_minutes.astype(np.float32),
+    )
+
+
+@st.cache_resource(max_entries=4)
+def _travel_tensor(year, months):
+    return build_travel_tensor(load_od_matrix(year), load_zone_neighbors())
+
+
+def load_travel_tensor(year=None):
+    """The travel tensor of `year`, rebuilt when the months in the OD matrix change."""
+    od = load_od_matrix(year)
+    return _travel_tensor(year, tuple(sorted(od.months.items())))
+
+
+def build_pickup_demand(year):
+    """
+    Expected pickups per (hour, zone) in one hour of an average day of `year`: the trip
+    cube's counts scaled back up by the sampling ratio in the manifest, over the days covered.
+    """
+    where = year_filter(year, 'Date')
+    trips = build_profit_tensor(('hour',), where=where).trips
+    days = query(f"SELECT COUNT(DISTINCT Date) AS days FROM trip_cube WHERE {where}", dtype_backend='numpy')
+    entries = [entry for tag, entry in read_months().items() if tag.startswith(f"{int(year)}-")]
+    sampled = sum(entry['rows_sampled'] for entry in entries)
+    scale = sum(entry['rows_read'] for entry in entries) / sampled if sampled else 1.0
+    return trips.T * scale / max(int(days['days'].iloc[0]), 1)
+
+
+@st.cache_data(max_entries=4)
+def _pickup_demand(year, months):
+    return build_pickup_demand(year)
+
+
+def load_pickup_demand(year):
+    """build_pickup_demand(), rebuilt when the months in the OD matrix change."""
+    od = load_od_matrix(year)
+    return _pickup_demand(int(year), tuple(sorted(od.months.items())))
+
+
+@st.cache_data(max_entries=4)
+def _vendor_gaps(year, months):
+    sql = f"""
+        SELECT PULocationID, Hour,
+               COALESCE(SUM(idle_minutes), 0)::DOUBLE AS idle_minutes,
+               COALESCE(SUM(idle_trips), 0)::DOUBLE AS idle_trips
+        FROM idle_stats
+        WHERE year = {int(year)}
+        GROUP BY ALL
+    """
+    try:
+        idle = query(sql, dtype_backend='numpy')
+    except duckdb.CatalogException:
+        return np.full((N_HOURS, N_ZONES), np.nan)
+    keys = [idle['Hour'].to_numpy(dtype=np.int64), idle['PULocationID'].to_numpy(dtype=np.int64)]
+    valid = (keys[0] >= 0) & (keys[0] < N_HOURS) & (keys[1] >= 0) & (keys[1] < N_ZONES)
+    flat = np.ravel_multi_index([k[valid] for k in keys], (N_HOURS, N_ZONES))
+    minutes = np.bincount(flat, weights=idle['idle_minutes'].to_numpy()[valid], minlength=N_HOURS * N_ZONES)
+    gaps = np.bincount(flat, weights=idle['idle_trips'].to_numpy()[valid], minlength=N_HOURS * N_ZONES)
+    minutes, gaps = minutes.reshape(N_HOURS, N_ZONES), gaps.reshape(N_HOURS, N_ZONES)
+    return np.divide(minutes, gaps, out=np.full(minutes.shape, np.nan), where=gaps > 0)
+
+
+def load_vendor_gaps(year):
+    """
+    Average gap in minutes between a vendor's consecutive trips by (hour, pickup zone) in
+    `year`, from the idle statistics; NaN where there is none, all NaN before the first
+    ingest. Cached per set of months ingested, so a new ingest is picked up.
+
+    The TLC data has no cab or driver key, so the gaps pool every cab of a vendor: they
+    measure the vendor's throughput in a zone, not how long a driver waits for a fare,
+    and are for display only (no ranking uses them).
+    """
+    months = {tag: month_checksum(entry) for tag, entry in read_months().items() if tag.startswith(f"{int(year)}-")}
+    return _vendor_gaps(int(year), tuple(sorted(months.items())))
+
+
+def profit_per_minute(origin, candidates, hour, profit, travel, trip_hour=None,
+                      fuel_cost_per_mile=config.FUEL_COST_PER_MILE):
+    """
+    Net profit per minute of driving empty from `origin` to each of `candidates` at `hour`
+    and taking the next trip there at `trip_hour` (default the same hour).
+
+    `profit` is the average profit per trip by zone for `trip_hour` (fuel on the paid miles
+    already paid). The empty drive costs its miles in fuel and its minutes in time; staying
+    in `origin` costs neither. Returns (drive minutes, drive miles, net profit per minute).
+    """
+    trip_hour = hour if trip_hour is None else trip_hour
+    candidates = np.asarray(candidates, dtype=np.int64)
+    stay = candidates == origin
+    drive_minutes = np.where(stay, 0.0, travel.minutes[hour, origin, candidates])
+    drive_miles = np.where(stay, 0.0, travel.miles[hour, origin, candidates])
+    net = profit[candidates] - drive_miles * fuel_cost_per_mile
+    per_minute = net / (drive_minutes + travel.trip_minutes[trip_hour, candidates])
+    return drive_minutes, drive_miles, per_minute
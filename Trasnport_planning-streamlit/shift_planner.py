@@ -0,0 +1,105 @@
+from dataclasses import dataclass
+import numpy as np
+import config
+from od_matrix import N_HOURS
+
+# Planning step: the driver picks a zone to work in once per slot
+SLOT_MINUTES = 60
+# Average profits are trusted from this many trips up; sparser cells earn nothing in a plan
+MIN_RATE_TRIPS = 3
+
+
+@dataclass(frozen=True)
+class ShiftPlan:
+    """
+    The best route for a shift, one entry per slot: the clock hour, the zone the driver
+    starts the slot in, the zone to work in, the empty drive to get there and the expected
+    net earnings of the slot. `expected_total` is the value of the whole plan, which also
+    accounts for drop-offs landing anywhere (the shown origins follow the most likely one).
+    """
+    hours: np.ndarray
+    origins: np.ndarray
+    zones: np.ndarray
+    drive_minutes: np.ndarray
+    earnings: np.ndarray
+    expected_total: float
+
+
+def earning_rate(profit, trips, demand, travel, min_trips=MIN_RATE_TRIPS):
+    """
+    Expected net earnings per working minute by (hour, zone): average profit per trip over
+    the minutes each trip takes, the wait for the pickup included.
+
+    Pickups in a zone arrive at its expected rate (`demand`, pickups per (hour, zone) in
+    an hour), so a driver waits 1 / rate minutes on average before each trip and quiet
+    zones earn less than their profit per trip suggests. Other drivers competing for the
+    same pickups are not modelled, so busy zones remain an upper bound. Cells whose
+    average profit rests on fewer than `min_trips` trips earn nothing. `profit` and `trips` are zones x hours
+    tables.
+    """
+    trip_minutes = travel.trip_minutes.astype(np.float64)
+    pickups_per_minute = np.asarray(demand, dtype=np.float64) / SLOT_MINUTES
+    wait = np.divide(1.0, pickups_per_minute, out=np.full(trip_minutes.shape, np.inf), where=pickups_per_minute > 0)
+    trusted = (np.asarray(trips).T >= min_trips) & (trip_minutes > 0) & np.isfinite(wait)
+    return np.divide(profit.T, trip_minutes + wait, out=np.zeros(trip_minutes.shape), where=trusted)
+
+
+def transition_matrix(od, hour):
+    """Where a driver working in each zone at `hour` ends up: the drop-off distribution of its trips."""
+    trips = od.trips(hour).astype(np.float64)
+    outflow = trips.sum(axis=1, keepdims=True)
+    # Zones without trips at that hour keep the driver where they are
+    stay = np.eye(len(trips))
+    return np.divide(trips, outflow, out=stay, where=outflow > 0)
+
+
+def slot_rewards(hour, rate, travel, fuel_cost_per_mile=config.FUEL_COST_PER_MILE):
+    """
+    Expected net earnings of the slot starting at `hour`, origin x zone worked in.
+
+    Driving there eats into the slot's working minutes and costs fuel; moves that don't
+    fit in the slot (or have no travel estimate) are ruled out with -inf.
+    """
+    drive_minutes = travel.minutes[hour].astype(np.float64)
+    drive_miles = travel.miles[hour].astype(np.float64)
+    np.fill_diagonal(drive_minutes, 0)
+    np.fill_diagonal(drive_miles, 0)
+    reachable = drive_minutes < SLOT_MINUTES
+    rewards = (SLOT_MINUTES - drive_minutes) * rate[hour][None, :] - drive_miles * fuel_cost_per_mile
+    return np.where(reachable, rewards, -np.inf), drive_minutes
+
+
+def plan_shift(start_zone, start_hour, n_slots, rate, travel, od, fuel_cost_per_mile=config.FUEL_COST_PER_MILE):
+    """
+    Plan a shift of `n_slots` hours from `start_zone` at `start_hour` by backward induction.
+
+    V_t(i) = max_j [ reward_t(i, j) + sum_k P_t(j, k) V_t+1(k) ]: each slot the driver drives
+    from zone i to zone j, works there, and ends the slot wherever its trips go. Every step
+    is a dense zones x zones array operation, so the whole plan costs n_slots of them.
+    """
+    hours = (start_hour + np.arange(n_slots)) % N_HOURS
+    rewards, drives, transitions, policies = [], [], [], []
+    value = np.zeros(len(rate[0]))
+    for hour in hours[::-1]:
+        reward, drive = slot_rewards(hour, rate, travel, fuel_cost_per_mile)
+        transition = transition_matrix(od, hour)
+        q = reward + (transition @ value)[None, :]
+        policy = q.argmax(axis=1)
+        value = q[np.arange(len(q)), policy]
+        rewards.append(reward)
+        drives.append(drive)
+        transitions.append(transition)
+        policies.append(policy)
+    expected_total = float(value[start_zone])
+    rewards, drives, transitions, policies = rewards[::-1], drives[::-1], transitions[::-1], policies[::-1]
+
+    origins, zones = np.zeros(n_slots, dtype=np.int64), np.zeros(n_slots, dtype=np.int64)
+    drive_minutes, earnings = np.zeros(n_slots), np.zeros(n_slots)
+    zone = start_zone
+    for t in range(n_slots):
+        origins[t] = zone
+        zones[t] = policies[t][zone]
+        drive_minutes[t] = drives[t][zone, zones[t]]
+        earnings[t] = rewards[t][zone, zones[t]]
+        zone = int(transitions[t][zones[t]].argmax())
+    return ShiftPlan(hours, origins, zones, drive_minutes, earnings, expected_total)
@@ -0,0 +1,292 @@
+import time
+import heapq
+import argparse
+import logging
+from collections import deque
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+import config
+from data_access import query_arrow
+from zones import N_ZONES
+from od_matrix import N_HOURS
+
+logger = logging.getLogger(__name__)
+
+# An idle driver asks its policy again after this long without a fare
+PATIENCE_MINUTES = 15
+
+# Driver states
+IDLE, ON_TRIP, REPOSITIONING = 0, 1, 2
+
+# Historical trip requests in pickup order: epoch seconds, trip length, zones and profit
+REQUESTS_SQL = f"""
+SELECT epoch(tpep_pickup_datetime)::BIGINT AS pickup,
+       date_diff('second', tpep_pickup_datetime, tpep_dropoff_datetime)::INTEGER AS duration,
+       PULocationID::SMALLINT AS pu_id,
+       DOLocationID::SMALLINT AS do_id,
+       profit::DOUBLE AS profit
+FROM trips
+WHERE PULocationID BETWEEN 1 AND {N_ZONES - 1} AND DOLocationID BETWEEN 1 AND {N_ZONES - 1}
+  AND tpep_dropoff_datetime > tpep_pickup_datetime AND profit IS NOT NULL
+"""
+
+
+@dataclass(frozen=True)
+class SimulationReport:
+    """
+    Outcome of replaying requests against one policy. Money is in dollars, times in
+    minutes; `driver_earnings` holds each driver's trip profit less empty-drive fuel.
+    """
+    policy: str
+    drivers: int
+    requests: int
+    served: int
+    earnings: float
+    idle_minutes: float
+    empty_minutes: float
+    empty_miles: float
+    events: int
+    seconds: float
+    driver_earnings: np.ndarray
+
+    @property
+    def served_share(self):
+        return self.served / self.requests if self.requests else 0.0
+
+    def summary(self):
+        """One row of headline numbers, for comparing policies side by side."""
+        return {
+            'policy': self.policy,
+            'drivers': self.drivers,
+            'requests': self.requests,
+            'served': self.served,
+            'served_share': round(self.served_share, 4),
+            'earnings': round(self.earnings, 2),
+            'earnings_per_driver': round(self.earnings / self.drivers, 2),
+            'idle_hours_per_driver': round(self.idle_minutes / 60 / self.drivers, 2),
+            'empty_miles': round(self.empty_miles, 1),
+            'events_per_minute': round(self.events / self.seconds * 60) if self.seconds else 0,
+        }
+
+
+def policy_table(policy):
+    """
+    The (hour, zone) table of destinations of `policy`: an array of LocationIDs
+    already, or a function (zone, hour) -> LocationID evaluated once per cell.
+    """
+    if callable(policy):
+        policy = [[policy(zone, hour) for zone in range(N_ZONES)] for hour in range(N_HOURS)]
+    table = np.asarray(policy, dtype=np.int64)
+    if table.shape != (N_HOURS, N_ZONES):
+        raise ValueError(f"A policy table has shape {(N_HOURS, N_ZONES)}, got {table.shape}")
+    return table
+
+
+def stay_policy():
+    """Never reposition: wait for the next fare wherever the last one ended."""
+    return np.broadcast_to(np.arange(N_ZONES), (N_HOURS, N_ZONES)).copy()
+
+
+def recommendation_policy(recommender):
+    """
+    The Route Recommendation advice ("Move to X" / "Stay"): the best-scoring candidate
+    of a FleetRecommender for the coming hour.
+    """
+    best = np.argmax(recommender.scores, axis=2)  # (hour, zone)
+    table = recommender.candidates[np.arange(N_ZONES)[None, :], best].astype(np.int64)
+    # Zones without any scored candidate stay put
+    scored = np.isfinite(np.max(recommender.scores, axis=2))
+    return np.where(scored & (table >= 0), table, np.arange(N_ZONES)[None, :])
+
+
+def q_table_policy(q_table, moves):
+    """The greedy policy of a (zone, hour, action) Q-table: the zone its best action moves to."""
+    best = np.argmax(q_table, axis=2)  # (zone, hour)
+    return moves[np.arange(N_ZONES)[:, None], best].T
+
+
+def load_requests(where=None):
+    """Trip requests from the cleaned trips (optionally filtered by the SQL predicate `where`), in pickup order."""
+    sql = REQUESTS_SQL + (f"  AND {where}\n" if where else "") + "ORDER BY pickup"
+    table = query_arrow(sql)
+    return {name: table.column(name).to_numpy() for name in table.column_names}
+
+
+def start_zones(requests, n_drivers, random_state=0):
+    """Starting zones drawn like the pickups of the first hour of requests."""
+    pickup = requests['pickup']
+    first_hour = requests['pu_id'][pickup < pickup[0] + 3600] if len(pickup) else np.arange(1, N_ZONES)
+    return np.random.default_rng(random_state).choice(first_hour, n_drivers)
+
+
+def simulate(requests, policy, travel, n_drivers, zones=None, patience_minutes=PATIENCE_MINUTES,
+             fuel_cost_per_mile=config.FUEL_COST_PER_MILE, name=None, random_state=0):
+    """
+    Replay `requests` (see load_requests) against `n_drivers` drivers following `policy`.
+
+    Discrete-event loop over two streams: the requests in pickup order, and a heap of
+    driver events (a trip or empty drive ending, an idle driver's patience running out).
+    A request is served by the driver idle longest in its pickup zone, or lost. After a
+    drop-off, and every `patience_minutes` while idle, a driver asks the policy where to
+    go for that hour and drives there empty (time and miles from `travel`) if it is
+    another zone. Policies are compiled to an (hour, zone) table first, so each decision
+    is a list lookup.
+    """
+    table = policy_table(policy)
+    hours, origins = np.indices((N_HOURS, N_ZONES))
+    drive_minutes = travel.minutes[hours, origins, table].astype(np.float64)
+    drive_miles = travel.miles[hours, origins, table].astype(np.float64)
+    # Moves without a travel estimate are not taken
+    movable = (table != origins) & np.isfinite(drive_minutes) & np.isfinite(drive_miles)
+    destination = np.where(movable, table, -1).tolist()
+    drive_seconds = (np.nan_to_num(drive_minutes) * 60).tolist()
+    drive_miles = np.nan_to_num(drive_miles).tolist()
+
+    pickups = requests['pickup'].tolist()
+    durations = requests['duration'].tolist()
+    pu_ids = requests['pu_id'].tolist()
+    do_ids = requests['do_id'].tolist()
+    profits = requests['profit'].tolist()
+    start = pickups[0] if pickups else 0
+    end = max((p + d for p, d in zip(pickups, durations)), default=start)
+
+    if zones is None:
+        zones = start_zones(requests, n_drivers, random_state)
+    zone = [int(z) for z in zones]
+    state = [IDLE] * n_drivers
+    token = [0] * n_drivers
+    idle_since = [start] * n_drivers
+    earned = [0.0] * n_drivers
+    pool = [deque() for _ in range(N_ZONES)]
+    heap = []
+    patience = patience_minutes * 60
+    for driver in range(n_drivers):
+        pool[zone[driver]].append((driver, 0))
+        heap.append((start + patience, driver, 0))
+    heapq.heapify(heap)
+
+    served = 0
+    idle_seconds = empty_seconds = empty_miles = 0.0
+    events = len(pickups)
+    push, pop = heapq.heappush, heapq.heappop
+
+    def release(driver, now):
+        """`driver` is free in its zone at `now`: reposition if the policy says so, otherwise wait."""
+        nonlocal empty_seconds, empty_miles
+        here = zone[driver]
+        hour = int(now // 3600) % N_HOURS
+        target = destination[hour][here]
+        token[driver] += 1
+        if target >= 0:
+            seconds = drive_seconds[hour][here]
+            miles = drive_miles[hour][here]
+            empty_seconds += seconds
+            empty_miles += miles
+            earned[driver] -= miles * fuel_cost_per_mile
+            state[driver] = REPOSITIONING
+            zone[driver] = target
+            push(heap, (now + seconds, driver, token[driver]))
+        else:
+            state[driver] = IDLE
+            idle_since[driver] = now
+            pool[here].append((driver, token[driver]))
+            push(heap, (now + patience, driver, token[driver]))
+
+    def advance(until):
+        """Handle every driver event up to `until`."""
+        nonlocal idle_seconds, events
+        while heap and heap[0][0] <= until:
+            now, driver, tag = pop(heap)
+            if tag != token[driver]:
+                continue
+            events += 1
+            if state[driver] == ON_TRIP:
+                release(driver, now)
+            elif state[driver] == REPOSITIONING:
+                # Arrived: wait for a fare here before asking again
+                token[driver] += 1
+                state[driver] = IDLE
+                idle_since[driver] = now
+                pool[zone[driver]].append((driver, token[driver]))
+                push(heap, (now + patience, driver, token[driver]))
+            else:
+                hour = int(now // 3600) % N_HOURS
+                if destination[hour][zone[driver]] >= 0:
+                    idle_seconds += now - idle_since[driver]
+                    release(driver, now)
+                else:
+                    push(heap, (now + patience, driver, tag))
+
+    started = time.perf_counter()
+    for i in range(len(pickups)):
+        now = pickups[i]
+        advance(now)
+        waiting = pool[pu_ids[i]]
+        while waiting:
+            driver, tag = waiting.popleft()
+            if tag == token[driver] and state[driver] == IDLE:
+                break
+        else:
+            continue
+        served += 1
+        idle_seconds += now - idle_since[driver]
+        earned[driver] += profits[i]
+        token[driver] += 1
+        state[driver] = ON_TRIP
+        zone[driver] = do_ids[i]
+        push(heap, (now + durations[i], driver, token[driver]))
+    advance(end)
+    idle_seconds += sum(end - idle_since[d] for d in range(n_drivers) if state[d] == IDLE)
+    seconds = time.perf_counter() - started
+
+    return SimulationReport(
+        policy=name or getattr(policy, '__name__', 'policy'),
+        drivers=n_drivers,
+        requests=len(pickups),
+        served=served,
+        earnings=float(sum(earned)),
+        idle_minutes=idle_seconds / 60,
+        empty_minutes=empty_seconds / 60,
+        empty_miles=empty_miles,
+        events=events,
+        seconds=seconds,
+        driver_earnings=np.array(earned),
+    )
+
+
+def compare_policies(requests, policies, travel, n_drivers, **kwargs):
+    """simulate() every policy of the `policies` dict (name -> policy) from the same start; one summary row each."""
+    zones = start_zones(requests, n_drivers, kwargs.pop('random_state', 0))
+    reports = [simulate(requests, policy, travel, n_drivers, zones=zones, name=name, **kwargs)
+               for name, policy in policies.items()]
+    return pd.DataFrame([report.summary() for report in reports]).set_index('policy')
+
+
+if __name__ == "__main__":
+    from recommendation import load_travel_tensor
+    from fleet import load_fleet_recommender
+    from q_learning import load_moves, load_checkpoint
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Replay historical trips against routing policies.")
+    parser.add_argument('--year', type=int, default=2025)
+    parser.add_argument('--where', default=None, help="Extra SQL predicate on the cleaned trips")
+    parser.add_argument('--drivers', type=int, default=1000)
+    parser.add_argument('--patience', type=float, default=PATIENCE_MINUTES, help="Minutes idle before re-deciding")
+    parser.add_argument('--q-table', default=config.Q_TABLE_PATH)
+    args = parser.parse_args()
+
+    where = f"year = {args.year}" + (f" AND {args.where}" if args.where else "")
+    requests = load_requests(where)
+    logger.info(f"Loaded {len(requests['pickup'])} requests.")
+    policies = {
+        'stay': stay_policy(),
+        'recommendation': recommendation_policy(load_fleet_recommender(args.year)),
+    }
+    try:
+        policies['q_table'] = q_table_policy(load_checkpoint(args.q_table)[0], load_moves())
+    except FileNotFoundError:
+        logger.info(f"No Q-table at '{args.q_table}', skipping that policy.")
+    print(compare_policies(requests, policies, load_travel_tensor(args.year), args.drivers,
+                           patience_minutes=args.patience).to_string())
@@ -0,0 +1,342 @@
+import os
+import json
+from dataclasses import dataclass
+import numpy as np
+import streamlit as st
+import config
+from zones import N_ZONES
+
+# Properties kept on each simplified feature; the choropleth only needs the ID
+KEPT_PROPERTIES = ('location_id', 'zone', 'borough')
+
+# Zones touch when their boundaries come within one grid cell of this many degrees (~11 m)
+ADJACENCY_GRID = 1e-4
+# Centroid neighbours are indexed up to this distance
+NEIGHBOR_RADIUS_KM = 25.0
+# Equirectangular projection around New York: km per degree of longitude and latitude
+KM_PER_DEG_LON = 111.32 * np.cos(np.radians(40.7))
+KM_PER_DEG_LAT = 110.57
+
+
+def _polygons(geometry):
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    return []
+
+
+def _quantize(ring, precision):
+    """Round a ring to `precision` decimals, dropping repeated points and the closing point."""
+    points = []
+    for x, y in (p[:2] for p in ring):
+        point = (round(x, precision), round(y, precision))
+        if not points or point != points[-1]:
+            points.append(point)
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    return points
+
+
+def _douglas_peucker(points, tolerance):
+    """Keep the endpoints and every point further than `tolerance` from the simplified line."""
+    if len(points) < 3:
+        return list(points)
+    pts = np.asarray(points, dtype=float)
+    keep = np.zeros(len(pts), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(pts) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        inner = pts[start + 1:end]
+        a, b = pts[start], pts[end]
+        dx, dy = b - a
+        length = np.hypot(dx, dy)
+        if length == 0:
+            dist = np.hypot(inner[:, 0] - a[0], inner[:, 1] - a[1])
+        else:
+            dist = np.abs(dx * (inner[:, 1] - a[1]) - dy * (inner[:, 0] - a[0])) / length
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.extend([(start, split), (split, end)])
+    return [points[i] for i in np.flatnonzero(keep)]
+
+
+def _junctions(rings):
+    """
+    Points where ring sharing changes: the same point seen with different neighbours.
+    Borders shared by two zones run between junctions, so they can be simplified once.
+    """
+    neighbours = {}
+    for ring in rings:
+        n = len(ring)
+        for i, point in enumerate(ring):
+            neighbours.setdefault(point, set()).add(frozenset((ring[i - 1], ring[(i + 1) % n])))
+    return {point for point, pairs in neighbours.items() if len(pairs) > 1}
+
+
+def _arcs(ring, junctions):
+    """Split a ring into arcs running from junction to junction (closed on the first one)."""
+    cuts = [i for i, point in enumerate(ring) if point in junctions]
+    if not cuts:
+        # A loop shared whole (or not at all) is cut at the same, smallest, point everywhere
+        cuts = [ring.index(min(ring))]
+    start = cuts[0]
+    rotated = ring[start:] + ring[:start] + [ring[start]]
+    offsets = [c - start for c in cuts] + [len(ring)]
+    return [rotated[a:b + 1] for a, b in zip(offsets[:-1], offsets[1:])]
+
+
+def simplify_zones(geojson, tolerance, precision=5):
+    """
+    Simplify the taxi-zone polygons to `tolerance` degrees without opening gaps between zones.
+
+    Rings are split into arcs at junctions and every arc is simplified once, in a canonical
+    direction, so both zones along a border get exactly the same vertices. Arcs of rings
+    that would collapse below a triangle are kept at full resolution. Returns a
+    FeatureCollection with one MultiPolygon feature per location_id (some zones come as
+    several features), carrying `id` = location_id.
+    """
+    features = []
+    for feature in geojson['features']:
+        polygons = [[_quantize(ring, precision) for ring in polygon] for polygon in _polygons(feature['geometry'])]
+        polygons = [[ring for ring in polygon if len(ring) >= 3] for polygon in polygons]
+        features.append((feature, [polygon for polygon in polygons if polygon]))
+
+    junctions = _junctions([ring for _, polygons in features for polygon in polygons for ring in polygon])
+
+    def canonical(arc):
+        reverse = arc[::-1]
+        return (tuple(reverse), True) if reverse < arc else (tuple(arc), False)
+
+    simplified = {}
+    protected = set()
+
+    def rebuild(ring_arcs):
+        ring = []
+        for arc in ring_arcs:
+            key, reversed_ = canonical(arc)
+            if key not in simplified:
+                simplified[key] = list(key) if key in protected else _douglas_peucker(list(key), tolerance)
+            points = simplified[key][::-1] if reversed_ else simplified[key]
+            ring.extend(points[:-1])
+        return ring
+
+    ring_arcs = [
+        [[_arcs(ring, junctions) for ring in polygon] for polygon in polygons] for _, polygons in features
+    ]
+    # Rings that collapse get their arcs protected; rebuild so their neighbours match
+    for polygons in ring_arcs:
+        for polygon in polygons:
+            for arcs in polygon:
+                if len(set(rebuild(arcs))) < 3:
+                    for arc in arcs:
+                        key = canonical(arc)[0]
+                        protected.add(key)
+                        simplified.pop(key, None)
+
+    out = []
+    for (feature, _), polygons in zip(features, ring_arcs):
+        coordinates = []
+        for polygon in polygons:
+            rings = [rebuild(arcs) for arcs in polygon]
+            coordinates.append([[list(p) for p in ring + ring[:1]] for ring in rings])
+        properties = {k: feature['properties'][k] for k in KEPT_PROPERTIES if k in feature['properties']}
+        out.append({
+            'type': 'Feature',
+            'id': str(properties.get('location_id')),
+            'properties': properties,
+            'geometry': {'type': 'MultiPolygon', 'coordinates': coordinates},
+        })
+    return {'type': 'FeatureCollection', 'features': list(_merge_by_id(out).values())}
+
+
+def _merge_by_id(features):
+    """Features indexed by `id`, the polygons of features sharing an ID merged into one MultiPolygon."""
+    merged = {}
+    for feature in features:
+        first = merged.setdefault(feature['id'], feature)
+        if first is not feature:
+            first['geometry'] = {
+                'type': 'MultiPolygon',
+                'coordinates': _polygons(first['geometry']) + _polygons(feature['geometry']),
+            }
+    return merged
+
+
+def simplified_path(source_path, tolerance):
+    base, _ = os.path.splitext(source_path)
+    return f"{base}.simplified-{tolerance:g}.geojson"
+
+
+def build_zone_geometry(source_path=config.ZONES_GEOJSON_PATH, tolerance=config.ZONE_SIMPLIFY_TOLERANCE):
+    """Write the simplified asset next to the source GeoJSON unless an up-to-date one exists."""
+    output_path = simplified_path(source_path, tolerance)
+    if os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(source_path):
+        return output_path
+    with open(source_path) as f:
+        geojson = json.load(f)
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(simplify_zones(geojson, tolerance), f, separators=(',', ':'))
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+@st.cache_resource
+def load_zone_geometry(tolerance=config.ZONE_SIMPLIFY_TOLERANCE):
+    """Simplified zone features indexed by location_id (as a string), loaded once per process."""
+    with open(build_zone_geometry(tolerance=tolerance)) as f:
+        geojson = json.load(f)
+    # Assets written before zones were merged may still repeat an ID
+    return _merge_by_id(geojson['features'])
+
+
+def zone_feature_collection(location_ids, tolerance=config.ZONE_SIMPLIFY_TOLERANCE):
+    """FeatureCollection holding only the zones in `location_ids`, to keep the page payload small."""
+    features = load_zone_geometry(tolerance)
+    return {
+        'type': 'FeatureCollection',
+        'features': [features[str(i)] for i in location_ids if str(i) in features],
+    }
+
+
+@dataclass(frozen=True)
+class ZoneNeighbors:
+    """
+    Spatial neighbour index of the taxi zones, as CSR arrays indexed by LocationID.
+
+    Row `z` of the adjacency holds the zones whose polygons touch zone `z`; row `z` of the
+    distance index holds every zone whose centroid lies within NEIGHBOR_RADIUS_KM of it,
+    nearest first. Queries slice one row, so they cost O(k).
+    """
+    adjacency_indptr: np.ndarray
+    adjacency: np.ndarray
+    distance_indptr: np.ndarray
+    by_distance: np.ndarray
+    distance_km: np.ndarray
+    # Centroids in km on the local projection, NaN for zones without geometry
+    centroid_km: np.ndarray
+
+    def adjacent(self, zone):
+        """LocationIDs of the zones bordering `zone`."""
+        return self.adjacency[self.adjacency_indptr[zone]:self.adjacency_indptr[zone + 1]]
+
+    def nearest(self, zone, k):
+        """(LocationIDs, km) of the `k` zones with the nearest centroids, nearest first."""
+        start = self.distance_indptr[zone]
+        end = min(start + k, self.distance_indptr[zone + 1])
+        return self.by_distance[start:end], self.distance_km[start:end]
+
+    def within(self, zone, radius_km):
+        """(LocationIDs, km) of the zones whose centroids lie within `radius_km`, nearest first."""
+        start, end = self.distance_indptr[zone], self.distance_indptr[zone + 1]
+        end = start + int(np.searchsorted(self.distance_km[start:end], radius_km, side='right'))
+        return self.by_distance[start:end], self.distance_km[start:end]
+
+    def nearby(self, zone, k):
+        """Bordering zones, topped up with the nearest centroids until there are at least `k`."""
+        adjacent = self.adjacent(zone)
+        if len(adjacent) >= k:
+            return adjacent
+        nearest, _ = self.nearest(zone, k + len(adjacent))
+        extra = nearest[~np.isin(nearest, adjacent)][:k - len(adjacent)]
+        return np.concatenate([adjacent, extra])
+
+
+def _csr(rows):
+    indptr = np.zeros(len(rows) + 1, dtype=np.int32)
+    indptr[1:] = np.cumsum([len(row) for row in rows])
+    return indptr
+
+
+def _ring_centroid(ring):
+    """(signed area, centroid) of a ring by the shoelace formula, in km."""
+    pts = np.asarray([p[:2] for p in ring], dtype=float) * [KM_PER_DEG_LON, KM_PER_DEG_LAT]
+    x, y = pts[:, 0], pts[:, 1]
+    x1, y1 = np.roll(x, -1), np.roll(y, -1)
+    cross = x * y1 - x1 * y
+    area = cross.sum() / 2
+    if area == 0:
+        return 0.0, pts.mean(axis=0)
+    return area, np.array([((x + x1) * cross).sum(), ((y + y1) * cross).sum()]) / (6 * area)
+
+
+def build_neighbor_index(geojson, radius_km=NEIGHBOR_RADIUS_KM, grid=ADJACENCY_GRID):
+    """
+    Build the ZoneNeighbors arrays from the taxi-zone GeoJSON.
+
+    Zones are adjacent when a vertex of one lies in the same or a neighbouring `grid` cell
+    as a vertex of the other, which also catches borders digitised with slightly different
+    vertices. Centroids are area-weighted over every outer ring of the zone.
+    """
+    cells = {}
+    moments = np.zeros((N_ZONES, 3))  # area, area * x, area * y
+    for feature in geojson['features']:
+        zone = int(feature['properties']['location_id'])
+        if not 0 < zone < N_ZONES:
+            continue
+        for polygon in _polygons(feature['geometry']):
+            for i, ring in enumerate(polygon):
+                area, centroid = _ring_centroid(ring)
+                # Holes (every ring after the first) take their area back out
+                weight = abs(area) if i == 0 else -abs(area)
+                moments[zone] += [weight, weight * centroid[0], weight * centroid[1]]
+                for x, y in (p[:2] for p in ring):
+                    cells.setdefault((round(x / grid), round(y / grid)), set()).add(zone)
+
+    neighbours = [set() for _ in range(N_ZONES)]
+    for (cx, cy), members in cells.items():
+        around = set()
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                around |= cells.get((cx + dx, cy + dy), set())
+        for zone in members:
+            neighbours[zone] |= around - {zone}
+    adjacency_rows = [sorted(row) for row in neighbours]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        centroid_km = moments[:, 1:] / moments[:, :1]
+    distances = np.hypot(*(centroid_km[:, None, :] - centroid_km[None, :, :]).transpose(2, 0, 1))
+    np.fill_diagonal(distances, np.inf)
+    distances[np.isnan(distances)] = np.inf
+    order = np.argsort(distances, axis=1, kind='stable')
+    distance_rows = [row[distances[zone, row] <= radius_km] for zone, row in enumerate(order)]
+
+    return ZoneNeighbors(
+        adjacency_indptr=_csr(adjacency_rows),
+        adjacency=np.fromiter((z for row in adjacency_rows for z in row), dtype=np.int16),
+        distance_indptr=_csr(distance_rows),
+        by_distance=np.concatenate(distance_rows).astype(np.int16),
+        distance_km=np.concatenate(
+            [distances[zone, row] for zone, row in enumerate(distance_rows)]
+        ).astype(np.float32),
+        centroid_km=centroid_km.astype(np.float32),
+    )
+
+
+def neighbor_index_path(source_path):
+    base, _ = os.path.splitext(source_path)
+    return f"{base}.neighbors.npz"
+
+
+@st.cache_resource
+def load_zone_neighbors(source_path=config.ZONES_GEOJSON_PATH):
+    """
+    The neighbour index, loaded once per process from the .neighbors.npz file next to
+    the source GeoJSON and rebuilt first when that file is missing or stale.
+    """
+    index_path = neighbor_index_path(source_path)
+    if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(source_path):
+        with open(source_path) as f:
+            index = build_neighbor_index(json.load(f))
+        with open(index_path + '.tmp', 'wb') as f:
+            np.savez(f, **vars(index))
+        os.replace(index_path + '.tmp', index_path)
+        return index
+    with np.load(index_path) as arrays:
+        return ZoneNeighbors(**{name: arrays[name] for name in arrays.files})
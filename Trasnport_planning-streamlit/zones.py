@@ -0,0 +1,95 @@
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+import streamlit as st
+from data_access import query
+
+# TLC LocationIDs run from 1 to 265; arrays are indexed by the ID itself, row 0 unused
+N_ZONES = 266
+UNKNOWN = "Unknown"
+
+
+@dataclass(frozen=True)
+class ZoneTable:
+    """
+    Zone dimension: one array per attribute, indexed by LocationID.
+
+    Lookups are plain fancy indexing, so a scalar ID or a whole column of IDs resolves
+    in one O(1)-per-element step. IDs outside the table resolve to row 0 ("Unknown").
+    """
+    location_id: np.ndarray
+    name: np.ndarray
+    borough: np.ndarray
+    service_zone: np.ndarray
+    # Borough as a small integer code into `boroughs`, for bincount-style rollups
+    borough_code: np.ndarray
+    boroughs: np.ndarray
+    known: np.ndarray
+
+    def _index(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        return np.where((ids > 0) & (ids < N_ZONES), ids, 0)
+
+    def names(self, ids):
+        return self.name[self._index(ids)]
+
+    def borough_of(self, ids):
+        return self.borough[self._index(ids)]
+
+    def service_zone_of(self, ids):
+        return self.service_zone[self._index(ids)]
+
+    def labels(self, ids):
+        """'<ID> - <Zone>' labels, as shown in zone pickers."""
+        ids = np.asarray(ids, dtype=np.int64)
+        return np.char.add(np.char.add(ids.astype(str), " - "), self.names(ids).astype(str))
+
+    def borough_totals(self, ids, weights=None):
+        """Sum `weights` (or count rows) per borough of `ids`, as a Series indexed by borough."""
+        totals = np.bincount(self.borough_code[self._index(ids)], weights=weights, minlength=len(self.boroughs))
+        return pd.Series(totals, index=self.boroughs, name='total')
+
+    def ids(self):
+        """Every LocationID present in the lookup, ascending."""
+        return self.location_id[self.known]
+
+
+def build_zone_table(lookup):
+    """Scatter the rows of the zone lookup (LocationID, Borough, Zone, service_zone) into ZoneTable arrays."""
+    ids = lookup['LocationID'].to_numpy(dtype=np.int64)
+    valid = (ids > 0) & (ids < N_ZONES)
+    ids = ids[valid]
+
+    def column(name):
+        values = np.full(N_ZONES, UNKNOWN, dtype=object)
+        values[ids] = lookup[name].fillna(UNKNOWN).to_numpy(dtype=object)[valid]
+        return values
+
+    name = column('Zone')
+    # Zones missing from the lookup still get a readable name
+    known = np.zeros(N_ZONES, dtype=bool)
+    known[ids] = True
+    name[~known] = [f"Zone {i}" for i in np.flatnonzero(~known)]
+    name[0] = UNKNOWN
+
+    borough = column('Borough')
+    boroughs, borough_code = np.unique(borough.astype(str), return_inverse=True)
+    return ZoneTable(
+        location_id=np.arange(N_ZONES, dtype=np.int16),
+        name=name,
+        borough=borough,
+        service_zone=column('service_zone'),
+        borough_code=borough_code.astype(np.int8),
+        boroughs=boroughs.astype(object),
+        known=known,
+    )
+
+
+@st.cache_resource
+def load_zones():
+    """The zone dimension, built from the catalog's zone lookup once per server process."""
+    lookup = query(
+        "SELECT LocationID, Borough, Zone, service_zone FROM zones ORDER BY LocationID",
+        dtype_backend='numpy',
+    )
+    return build_zone_table(lookup)